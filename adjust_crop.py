@@ -1,5 +1,7 @@
 import sys
 
+from detect_letter_box import CropRecord, crop_line
+
 def get_frame_height_width(crop_str):
     _, crop_info  = crop_str.split('=')
     width, height, x, y = crop_info.split(':')
@@ -7,9 +9,18 @@ def get_frame_height_width(crop_str):
 
 
 def adjust_crop(crop_list, return_list=True):
+    """widen crops back to the source aspect ratio; pipe-delimited lines (with header) or CropRecord tuples"""
     is_header = True
     list_result = []
     for line in crop_list:
+        if isinstance(line, CropRecord):   # typed records need no parsing
+            new_width = int(line.crop_height * float(line.video_width) / line.video_height)
+            record = line._replace(crop_width=new_width, crop_x=(line.video_width - new_width) // 2)
+            if return_list:
+                list_result.append(record)
+            else:
+                print(crop_line(record).strip())
+            continue
         line = line.strip()
         if is_header:
             is_header = False
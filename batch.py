@@ -0,0 +1,190 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import traceback
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from media_runner import TIMEOUT_ENV
+
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger()
+
+TRUE_VALUES = ("1", "true", "yes", "y", "t")
+
+
+def load_manifest(path_manifest):
+    """Rows of a CSV (with a header) or JSONL manifest as dicts; each needs 'path_content', any other
+    columns are clip() options for that row (empty cells keep the batch settings)"""
+    list_rows = []
+    with open(path_manifest, 'rt') as f:
+        if path_manifest.endswith(".jsonl") or path_manifest.endswith(".json"):
+            list_rows = [json.loads(line) for line in f if len(line.strip())]
+        else:
+            list_rows = [dict(row) for row in csv.DictReader(f)]
+    list_rows = [{k.strip(): v for k, v in row.items() if k is not None and v is not None and v != ""} for row in list_rows]
+    return list_rows
+
+
+def row_args(row, parser):
+    """Command-line arguments for one manifest row, typed and checked by clip()'s own parser"""
+    dict_actions = {x.dest: x for x in parser._actions if len(x.option_strings)}
+    list_args = []
+    for key, value in row.items():
+        if key not in dict_actions:
+            raise ValueError(f"unknown option '{key}'")
+        action = dict_actions[key]
+        if action.nargs == 0:   # flags, e.g. overwrite
+            if str(value).strip().lower() in TRUE_VALUES:
+                list_args.append(action.option_strings[0])
+        elif action.nargs in ('+', '*') or type(action.nargs) == int:
+            list_values = value if type(value) == list else str(value).split()
+            list_args += [action.option_strings[0]] + [str(x) for x in list_values]
+        else:
+            list_args += [action.option_strings[0], str(value)]
+    return list_args
+
+
+def batch_jobs(list_rows, path_result):
+    """Assign each row a result directory (its own 'path_result', else one per video stem under path_result)"""
+    list_jobs = []
+    dict_names = {}
+    for idx, row in enumerate(list_rows):
+        row = dict(row)
+        if "path_content" not in row:
+            list_jobs.append({"index": idx, "row": row, "error": "missing 'path_content'"})
+            continue
+        if "path_result" not in row:
+            name = Path(str(row["path_content"])).stem
+            if Path(str(row["path_content"])).name == "video.mp4":   # contentai layout, named by its directory
+                name = Path(str(row["path_content"])).parent.name
+            dict_names[name] = dict_names.get(name, 0) + 1
+            if dict_names[name] > 1:
+                name = f"{name}-{idx}"
+            row["path_result"] = os.path.join(path_result, name)
+        list_jobs.append({"index": idx, "row": row})
+    return list_jobs
+
+
+def batch_job(job):
+    """Run one manifest row with clip() in this (long-lived) worker; never raises, returns its status"""
+    import main   # imported once per worker process; its parser and caches stay warm for later rows
+
+    dict_status = {"index": job["index"], "path_content": job["row"].get("path_content", ""),
+                   "path_result": job["row"].get("path_result", ""), "status": "error", "seconds": 0.0}
+    if "error" not in job and not os.path.exists(dict_status["path_content"]):
+        job["error"] = f"missing video '{dict_status['path_content']}'"
+    if "error" in job:
+        dict_status["error"] = job["error"]
+        return dict_status
+    timeout = os.environ.get(TIMEOUT_ENV)
+    time_start = time.monotonic()
+    try:
+        list_args = job["args"] + row_args(job["row"], main.clip_parser())
+        dict_result = main.clip(args=list_args, download=False)
+        if dict_result is None:
+            dict_status["error"] = "clip() returned no result (e.g. an unknown profile)"
+        else:
+            dict_status["status"] = "ok"
+            dict_status["scenes"] = len(dict_result["results"])
+            dict_status["results"] = dict_result["results"]
+            if "metrics" in dict_result:
+                dict_status["metrics"] = dict_result["metrics"]
+    except (Exception, SystemExit) as err:   # argparse exits on bad rows
+        dict_status["error"] = f"{type(err).__name__}: {err}"
+        logger.error(f"batch job {job['index']} ({dict_status['path_content']}) failed: {dict_status['error']}")
+        logger.debug(traceback.format_exc())
+    finally:   # clip() sets the media timeout for its own run; the next row starts from the worker's setting
+        if timeout is None:
+            os.environ.pop(TIMEOUT_ENV, None)
+        else:
+            os.environ[TIMEOUT_ENV] = timeout
+    dict_status["seconds"] = time.monotonic() - time_start
+    return dict_status
+
+
+def batch(path_manifest, path_result, num_workers=1, list_args=None, path_output=None):
+    """Run every manifest row over a pool of worker processes; writes each asset's data.json under its
+    result directory and one consolidated file (default path_result/batch.json) with per-job status"""
+    list_jobs = batch_jobs(load_manifest(path_manifest), path_result)
+    for job in list_jobs:
+        job["args"] = list(list_args or [])
+    if path_output is None:
+        path_output = os.path.join(path_result, "batch.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path_output)), exist_ok=True)
+
+    logger.info(f"Running {len(list_jobs)} jobs from '{path_manifest}' with {num_workers} workers")
+    time_start = time.monotonic()
+    list_status = []
+    def job_done(dict_status):
+        list_status.append(dict_status)
+        logger.info(f"[{dict_status['index']}] {dict_status['status']} {dict_status['path_content']} ({dict_status['seconds']:.1f}s)")
+    if num_workers > 1:
+        with ProcessPoolExecutor(num_workers) as executor:   # non-daemonic, so jobs can still use encode pools
+            for dict_status in executor.map(batch_job, list_jobs):
+                job_done(dict_status)
+    else:
+        for job in list_jobs:
+            job_done(batch_job(job))
+
+    dict_batch = {"config": {"manifest": os.path.abspath(path_manifest), "args": list_args or [], "workers": num_workers,
+                             "timestamp": str(datetime.now()), "seconds": time.monotonic() - time_start},
+                  "jobs": list_status, "ok": len([x for x in list_status if x["status"] == "ok"]),
+                  "failed": len([x for x in list_status if x["status"] != "ok"])}
+    with open(path_output, 'wt') as f:
+        json.dump(dict_batch, f)
+    logger.info(f"{dict_batch['ok']} of {len(list_status)} jobs succeeded, written to '{path_output}'")
+    return dict_batch
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="""Run the clip extractor over many videos from one manifest...""",
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog="""
+        Manifest columns are 'path_content' plus any main.py option for that row (e.g. path_scenes, clip_bounds,
+        snack_id, profile); any other arguments apply to every row, e.g.
+
+            path_content,path_scenes,clip_bounds,snack_id,profile
+            videos/a.mp4,metadata/a,15 -15,1,popcorn
+            videos/b.mp4,metadata/b,,2,
+
+            python batch.py --manifest nightly.csv --path_result results/ --workers 4 --profile small --duration_max 90
+        """)
+    parser.add_argument('--manifest', type=str, required=True, help='CSV (with header) or JSONL manifest, one video per row')
+    parser.add_argument('--path_result', type=str, required=True, help='rows without a path_result write under here (one directory per video)')
+    parser.add_argument('--workers', type=int, default=1, help='videos processed in parallel (default %(default)s)')
+    parser.add_argument('--batch_file', type=str, default=None, help='consolidated status and results (default PATH_RESULT/batch.json)')
+    run_settings, list_args = parser.parse_known_args(args)
+    dict_batch = batch(run_settings.manifest, run_settings.path_result, max(1, run_settings.workers),
+                       list_args, run_settings.batch_file)
+    return 0 if dict_batch["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
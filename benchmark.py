@@ -0,0 +1,430 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+import tempfile
+import shutil
+import json
+import time
+
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger()
+
+
+def timed(func, *args, **kwargs):
+    """Run a function and return its result with elapsed wall-clock seconds"""
+    time_start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - time_start
+
+
+def scene_grid(duration, num_scenes, scene_length, scene_offset=0):
+    """Evenly spaced scenes of fixed length across a duration"""
+    step = max(duration - scene_offset, scene_length) / num_scenes
+    return [[scene_offset + idx * step, min(scene_offset + idx * step + scene_length, duration)] for idx in range(num_scenes)]
+
+
+def synthetic_video(path_video, duration=120, size="960x540", letterbox=0, fps=25):
+    """Deterministic test video from lavfi (testsrc with a tone), optionally with black bars of letterbox pixels
+    above and below; made once per path"""
+    if os.path.exists(path_video):
+        return path_video
+    width, height = [int(x) for x in size.split("x")]
+    cmd_list = ["ffmpeg", "-v", "quiet", "-y", "-f", "lavfi", "-i", f"testsrc=size={width}x{height - 2 * letterbox}:rate={fps}:duration={duration}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}"]
+    if letterbox > 0:   # lift testsrc's own black bar above the crop detection limit so only the padding is black
+        cmd_list += ["-vf", f"lutyuv=y=max(val\\,64),pad={width}:{height}:0:{letterbox}:black"]
+    cmd_list += ["-c:v", "libx264", "-preset", "ultrafast", "-g", str(fps * 2), "-pix_fmt", "yuv420p",
+                 "-c:a", "aac", "-shortest", path_video]
+    from media_runner import run_media
+    if run_media(cmd_list, stdout=False).returncode != 0:
+        logger.error(f"Failed to make synthetic video '{path_video}' (is ffmpeg with libx264 installed?)")
+        return None
+    return path_video
+
+
+def synthetic_metadata(dir_content, duration=3600, events_per_hour=20000, num_tags=20, shot_length=4, seed=0):
+    """Extractor outputs under dir_content that parse_results reads: dsai_places tags (one result per synthetic
+    event) and dsai_sceneboundary scenes over fixed-length shots"""
+    df = synthetic_events(duration, events_per_hour, num_tags, seed, tag_type="tag", source_event="image")
+    dict_config = {"version": "1.0.0", "extractor": "synthetic", "input": "synthetic.mp4", "timestamp": "2020-01-01 00:00:00"}
+    dict_places = {"config": dict_config, "results": [{"time_event": float(t), "scores": {tag: float(score)}}
+                                                      for t, tag, score in zip(df["time_begin"], df["tag"], df["score"])]}
+    num_shots = max(1, int(duration / shot_length))
+    list_shots = [{"id": idx, "time_begin": idx * shot_length, "time_end": (idx + 1) * shot_length} for idx in range(num_shots)]
+    list_segments = [{"id": idx, "shots": list(range(idx, min(idx + 5, num_shots))), "score": 0.9} for idx in range(0, num_shots, 5)]
+    dict_scenes = {"shots": list_shots, "annotations": [{"annotator": {"name": "sceneboundary", "timestamp": dict_config["timestamp"]},
+                                                         "classifier": {"threshold": 0.5, "frame_position": 0}, "segments": list_segments}]}
+    for extractor, dict_data in [("dsai_places", dict_places), ("dsai_sceneboundary", dict_scenes)]:
+        os.makedirs(os.path.join(dir_content, extractor), exist_ok=True)
+        with open(os.path.join(dir_content, extractor, "data.json"), 'wt') as f:
+            json.dump(dict_data, f)
+    return dir_content
+
+
+def bench_parse_results(dir_content, parser_type=("tag", "scene")):
+    """Time parse_results without a cache, while filling it, from the disk cache, and with compact tables"""
+    import metadata_cache
+    from event_retrieval import parse_results
+
+    shutil.rmtree(os.path.join(dir_content, metadata_cache.CACHE_SUBDIR), ignore_errors=True)
+    list_results = []
+    dict_frames = {}
+    list_handlers, log_level = logger.handlers[:], logger.level
+    for name, use_cache, compact in [("uncached", False, False), ("cache_fill", True, False), ("cache_disk", True, False),
+                                     ("compact", False, True)]:
+        metadata_cache._metadata_memory.clear()   # disk, not this process's memory, is what a new run sees
+        dict_frames[name], time_run = timed(parse_results, dir_content, list(parser_type), use_cache=use_cache, compact=compact)
+        list_results.append({"benchmark": "parse_results", "mode": name, "seconds": time_run, "written": len(dict_frames[name])})
+    logger.handlers[:], logger.level = list_handlers, log_level   # some parsers add a root handler of their own
+    is_match = all([frames_match(dict_frames["uncached"], dict_frames[x], ["time_begin", "time_end", "time_event", "score"])
+                    for x in ["cache_fill", "cache_disk"]])
+    for result in list_results:
+        result["match"] = is_match
+    if not is_match:
+        logger.error("parse_results returned different events from its cache!")
+    return list_results
+
+
+def bench_detect_letter_box(path_video, crop_expected=None, crop_tolerance=16):
+    """Time each letterbox sample mode; with the known crop (width, height, x, y) of a synthetic video, check it
+    (within cropdetect's default rounding of 16 pixels)"""
+    from detect_letter_box import detect_letter_box
+
+    list_results = []
+    for mode in ["head", "sparse", "frames"]:
+        list_records, time_run = timed(detect_letter_box, [path_video], sample_mode=mode, return_records=True)
+        result = {"benchmark": "detect_letter_box", "mode": mode, "seconds": time_run, "written": len(list_records)}
+        if crop_expected is not None:
+            crop_found = tuple(list_records[0][1:5]) if len(list_records) else (0, 0, 0, 0)
+            result["match"] = all([abs(a - b) <= crop_tolerance for a, b in zip(crop_found, crop_expected)])
+            if not result["match"]:
+                logger.error(f"detect_letter_box mode '{mode}' found crop {crop_found} instead of {tuple(crop_expected)}!")
+        list_results.append(result)
+    return list_results
+
+
+def bench_get_clips(path_video, scene_list, profile="popcorn", batch_size=8, batch_gap=10, num_workers=1):
+    """Compare one-process-per-clip cutting against batched, smart rendered (and optionally parallel) cutting
+    for the same scenes"""
+    from getclips import get_clips
+
+    list_modes = [("per_clip", 1, 1, "encode"), ("batched", batch_size, 1, "encode"), ("smart", 1, 1, "smart")]
+    if num_workers > 1:
+        list_modes.append(("parallel", batch_size, num_workers, "encode"))
+    list_results = []
+    for name, size, workers, cut_mode in list_modes:
+        with tempfile.TemporaryDirectory() as dir_temp:
+            list_clips, time_run = timed(get_clips, path_video, scene_list, dir_temp, overwrite=True,
+                                         profile=profile, batch_size=size, batch_gap=batch_gap, num_workers=workers,
+                                         cut_mode=cut_mode)
+            list_results.append({"benchmark": "get_clips", "mode": name, "profile": profile, "scenes": len(scene_list),
+                                 "seconds": time_run, "clips": [os.path.basename(x) for x in list_clips],
+                                 "written": len([x for x in list_clips if os.path.exists(x)])})
+    if any([x["clips"] != list_results[0]["clips"] for x in list_results]):
+        logger.error("Batched, smart, parallel, and per-clip paths returned different clip lists!")
+    return list_results
+
+
+def synthetic_events(duration=3600, events_per_hour=20000, num_tags=20, seed=0, tag_type="identity", source_event="face"):
+    """Flattened extractor events (same columns as parse_results) with clusters of high scores per tag"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    num_events = int(events_per_hour * duration / 3600)
+    time_begin = np.sort(rng.uniform(0, duration, num_events))
+    tag = rng.integers(0, num_tags, num_events)
+    # slow per-tag drift in confidence so that runs of high scores form (and break) over time
+    phase = rng.uniform(0, 2 * np.pi, num_tags)
+    score = np.clip(0.7 + 0.25 * np.sin(time_begin / 60 + phase[tag]) + rng.normal(0, 0.05, num_events), 0, 1)
+    return pd.DataFrame({"time_begin": time_begin, "time_end": time_begin + rng.uniform(0, 2, num_events),
+                         "time_event": time_begin, "source_event": source_event, "tag_type": tag_type,
+                         "tag": [f"tag_{x}" for x in tag], "score": score, "details": "", "extractor": "synthetic"})
+
+
+def frames_match(df_a, df_b, list_numeric):
+    """Same rows, columns, and values (numeric columns to float tolerance) in two result frames"""
+    import numpy as np
+
+    if df_a is None or df_b is None:
+        return df_a is None and df_b is None
+    if len(df_a) != len(df_b) or list(df_a.columns) != list(df_b.columns):
+        return False
+    for col in df_a.columns:
+        if col in list_numeric:
+            if not np.allclose(df_a[col].astype(float), df_b[col].astype(float), equal_nan=True):
+                return False
+        elif not (df_a[col].astype(str).values == df_b[col].astype(str).values).all():
+            return False
+    return True
+
+
+def bench_event_rle(df_events, score_threshold=0.8, duration_threshold=10, duration_expand=5):
+    """Time the pandas (per-group resample) and numpy (all groups at once) event_rle engines and check they agree"""
+    from event_retrieval import event_rle
+
+    list_results = []
+    dict_frames = {}
+    for engine in ["pandas", "numpy"]:
+        try:
+            dict_frames[engine], time_run = timed(event_rle, df_events, score_threshold=score_threshold,
+                                                  duration_threshold=duration_threshold, duration_expand=duration_expand, engine=engine)
+        except Exception as err:   # e.g. DataFrame.append is gone in newer pandas
+            logger.error(f"event_rle engine '{engine}' failed: {err}")
+            continue
+        list_results.append({"benchmark": "event_rle", "mode": engine, "events": len(df_events),
+                             "seconds": time_run, "written": len(dict_frames[engine])})
+    if len(dict_frames) == 2:
+        is_match = frames_match(dict_frames["pandas"], dict_frames["numpy"], ["time_begin", "time_end", "score"])
+        for result in list_results:
+            result["match"] = is_match
+        if not is_match:
+            logger.error("event_rle engines returned different scenes!")
+    return list_results
+
+
+def bench_event_alignment(df_events, df_scenes, df_events_fallback=None, max_duration=90, score_threshold=0.5):
+    """Time the pandas (per-scene search) and numpy (all scenes at once) event_alignment engines and check they agree"""
+    from event_retrieval import event_alignment
+
+    list_results = []
+    dict_frames = {}
+    for engine in ["pandas", "numpy"]:
+        dict_frames[engine], time_run = timed(event_alignment, df_events, df_scenes, max_duration,
+                                              df_events_fallback=df_events_fallback, score_threshold=score_threshold, engine=engine)
+        list_results.append({"benchmark": "event_alignment", "mode": engine, "events": len(df_events), "scenes": len(df_scenes),
+                             "seconds": time_run, "written": len(dict_frames[engine])})
+    is_match = frames_match(dict_frames["pandas"], dict_frames["numpy"], ["time_begin", "time_end"])
+    for result in list_results:
+        result["match"] = is_match
+    if not is_match:
+        logger.error("event_alignment engines returned different scenes!")
+    return list_results
+
+
+def event_table_memory(table_job):
+    """Build an asset's event table from several parser-sized tables, as parse_results does, in a fresh
+    process so that its peak RSS only reflects this table; compact tables are shrunk as each one is read"""
+    import resource
+    import pandas as pd
+    from event_retrieval import compact_events, concat_events
+
+    duration, events_per_hour, num_tags, compact = table_job
+    rss_base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    time_start = time.perf_counter()
+    list_df = []
+    for idx, (tag_type, source_event) in enumerate([("identity", "face"), ("tag", "image"), ("shot", "video"), ("keyword", "transcript")]):
+        df = synthetic_events(duration, events_per_hour, num_tags, seed=idx, tag_type=tag_type, source_event=source_event)
+        if compact:
+            df = compact_events(df)
+        list_df.append(df[df["tag_type"].isin(["identity", "tag"])].reset_index(drop=True))
+        df = None
+    df_table = concat_events(list_df) if compact else pd.concat(list_df, sort=False)
+    list_df = None
+    time_run = time.perf_counter() - time_start
+    rss_now = 0
+    if os.path.exists("/proc/self/statm"):   # resident pages while only the final table is held
+        with open("/proc/self/statm", 'rt') as f:
+            rss_now = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    return {"rows": len(df_table), "seconds": time_run, "table_mb": df_table.memory_usage(deep=True).sum() / (1 << 20),
+            "base_rss_mb": rss_base, "rss_mb": rss_now,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}   # ru_maxrss is KB on linux
+
+
+def bench_event_tables(duration=3600, events_per_hour=20000, num_tags=20):
+    """Peak RSS and table size of object-dtype versus compact event tables, each built in its own process"""
+    from multiprocessing import get_context
+
+    list_results = []
+    for name, compact in [("object", False), ("compact", True)]:
+        with get_context("spawn").Pool(1) as p:
+            result = p.apply(event_table_memory, [(duration, events_per_hour, num_tags, compact)])
+        list_results.append({"benchmark": "event_tables", "mode": name, "seconds": result["seconds"], "written": result["rows"],
+                             "table_mb": result["table_mb"], "base_rss_mb": result["base_rss_mb"], "rss_mb": result["rss_mb"],
+                             "peak_rss_mb": result["peak_rss_mb"]})
+    return list_results
+
+
+STARTUP_HEAVY = ["pandas", "numpy", "contentai_metadata_flatten", "getclips", "event_retrieval"]   # left to the stages
+
+
+def bench_startup(budget_seconds=0.5, repeats=3):
+    """Cold start of main.py in fresh interpreters (best of a few runs): the cumulative '-X importtime' of main,
+    which must not pull in the heavy stage modules, and the wall time of '--help'; over budget is a failed match"""
+    import subprocess
+
+    dir_repo = os.path.dirname(os.path.abspath(__file__))
+    list_results = []
+    list_times, list_heavy, num_modules = [], [], 0
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=dir_repo,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        list_lines = [x.split("|") for x in proc.stderr.splitlines() if x.startswith("import time:") and x.count("|") == 2]
+        list_modules = [x[2].strip() for x in list_lines]
+        if proc.returncode != 0 or "main" not in list_modules:
+            logger.error(f"startup: 'import main' failed ({proc.stderr.strip().splitlines()[-1:]})")
+            return list_results
+        list_times.append(int(list_lines[list_modules.index("main")][1]) / 1e6)   # cumulative microseconds
+        list_heavy = [x for x in STARTUP_HEAVY if x in list_modules]
+        num_modules = len(list_modules)
+    list_results.append({"benchmark": "startup", "mode": "import_main", "seconds": min(list_times), "written": num_modules,
+                         "budget_seconds": budget_seconds, "heavy_imports": list_heavy,
+                         "match": min(list_times) <= budget_seconds and not list_heavy})
+    if list_heavy:
+        logger.error(f"startup: 'import main' loads {list_heavy}, which should wait for the stages that use them")
+
+    list_times = []
+    for _ in range(repeats):
+        time_start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "main.py", "--help"], cwd=dir_repo, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True)
+        list_times.append(time.perf_counter() - time_start)
+    list_results.append({"benchmark": "startup", "mode": "help", "seconds": min(list_times), "written": len(proc.stdout.splitlines()),
+                         "budget_seconds": budget_seconds, "match": proc.returncode == 0 and min(list_times) <= budget_seconds})
+    for result in list_results:
+        if result["seconds"] > budget_seconds:
+            logger.error(f"startup: '{result['mode']}' took {result['seconds']:.3f}s, over the {budget_seconds}s budget")
+    return list_results
+
+
+def result_key(result):
+    return "/".join([str(result.get(x, "")) for x in ["benchmark", "mode", "profile"]])
+
+
+def compare_baseline(list_results, path_baseline, regression_ratio=1.25, min_seconds=0.05):
+    """Mark each result with its time relative to the same benchmark in an earlier results file; slower than
+    regression_ratio (and min_seconds) is flagged as a regression"""
+    with open(path_baseline, 'rt') as f:
+        dict_baseline = json.load(f)
+    list_baseline = dict_baseline["results"] if type(dict_baseline) == dict else dict_baseline   # older files are a bare list
+    dict_seconds = {result_key(x): x["seconds"] for x in list_baseline}
+    num_regressions = 0
+    for result in list_results:
+        seconds_base = dict_seconds.get(result_key(result))
+        if seconds_base is None or seconds_base <= 0:
+            continue
+        result["baseline_seconds"] = seconds_base
+        result["ratio"] = result["seconds"] / seconds_base
+        result["regression"] = result["ratio"] > regression_ratio and result["seconds"] - seconds_base > min_seconds
+        if result["regression"]:
+            num_regressions += 1
+            logger.warning(f"[{result_key(result)}] regression: {result['seconds']:.3f}s vs {seconds_base:.3f}s baseline")
+    return num_regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="""Timing comparisons for clip extraction stages...""",
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog="""
+        Example execution patterns...
+            # full offline suite: synthetic letterboxed video and extractor metadata, JSON results for later comparison
+            python benchmark.py --path_output bench-1.2.0.json
+
+            # same suite, flagging anything 25% slower than an earlier run
+            python benchmark.py --path_output bench-new.json --path_baseline bench-1.2.0.json
+
+            # compare per-clip and batched cutting of 10 scenes (30s each) with the popcorn and small profiles
+            python benchmark.py --path_content results-witch/video.mp4 --num_scenes 10 --scene_length 30 --profile popcorn,small
+
+            # compare event_rle engines on 50k synthetic events per hour over a two hour asset
+            python benchmark.py --events_per_hour 50000 --duration 7200 --video_duration 0
+
+            # peak memory of object versus compact event tables for a three hour asset with per-frame detections
+            python benchmark.py --events_per_hour 1000000 --duration 10800 --video_duration 0
+
+            # cold start of main.py against a tighter budget
+            python benchmark.py --startup_budget 0.25 --video_duration 0
+        """)
+    parser.add_argument('--path_content', type=str, default='', help='input video (default: a synthetic video)')
+    parser.add_argument('--path_output', type=str, default='', help='also write JSON results to this file')
+    parser.add_argument('--path_baseline', type=str, default='', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--regression_ratio', type=float, default=1.25, help='slowdown versus the baseline flagged as a regression (default %(default)s)')
+    parser.add_argument('--profile', type=str, default='popcorn', help='processing profile to use, a comma list times each one (default %(default)s)')
+    parser.add_argument('--num_scenes', type=int, default=10, help='number of evenly spaced scenes (default %(default)s)')
+    parser.add_argument('--scene_length', type=float, default=30, help='length of each scene in seconds (default %(default)s)')
+    parser.add_argument('--clip_batch_size', type=int, default=8, help='max clips cut from one ffmpeg process (default %(default)s)')
+    parser.add_argument('--clip_batch_gap', type=float, default=10, help='max seconds between clips in one batch (default %(default)s)')
+    parser.add_argument('--encode_workers', type=int, default=1, help='also time this many parallel encode jobs (default %(default)s)')
+    parser.add_argument('--duration', type=float, default=3600, help='synthetic metadata duration in seconds (default %(default)s)')
+    parser.add_argument('--events_per_hour', type=int, default=20000, help='synthetic events per hour (default %(default)s)')
+    parser.add_argument('--num_tags', type=int, default=20, help='distinct synthetic tags (default %(default)s)')
+    parser.add_argument('--video_duration', type=float, default=120, help='synthetic video length in seconds, 0 skips media benchmarks without path_content (default %(default)s)')
+    parser.add_argument('--video_size', type=str, default='960x540', help='synthetic video size (default %(default)s)')
+    parser.add_argument('--video_letterbox', type=int, default=60, help='black bar height above and below the synthetic video (default %(default)s)')
+    parser.add_argument('--startup_budget', type=float, default=0.5, help='max seconds for a cold import of main.py and its --help (default %(default)s)')
+    run_settings = vars(parser.parse_args(args))
+
+    list_results = bench_startup(run_settings['startup_budget'])
+    with tempfile.TemporaryDirectory() as dir_temp:
+        dir_meta = synthetic_metadata(os.path.join(dir_temp, "metadata"), run_settings['duration'],
+                                      run_settings['events_per_hour'], run_settings['num_tags'])
+        list_results += bench_parse_results(dir_meta)
+
+        df_events = synthetic_events(run_settings['duration'], run_settings['events_per_hour'], run_settings['num_tags'])
+        list_results += bench_event_rle(df_events)
+        df_shots = synthetic_events(run_settings['duration'], run_settings['events_per_hour'], 1, seed=1,
+                                    tag_type="shot", source_event="video")
+        df_scenes = df_events[["time_begin", "time_end"]].sample(n=min(len(df_events), 200), random_state=0)
+        df_scenes["time_end"] = df_scenes["time_begin"] + 60
+        list_results += bench_event_alignment(df_shots, df_scenes.reset_index(drop=True), df_events_fallback=df_events)
+        list_results += bench_event_tables(run_settings['duration'], run_settings['events_per_hour'], run_settings['num_tags'])
+
+        path_video = run_settings['path_content']
+        crop_expected = None
+        if not len(path_video) and run_settings['video_duration'] > 0:
+            path_video = synthetic_video(os.path.join(dir_temp, "synthetic.mp4"), run_settings['video_duration'],
+                                         run_settings['video_size'], run_settings['video_letterbox'])
+            width, height = [int(x) for x in run_settings['video_size'].split("x")]
+            crop_expected = (width, height - 2 * run_settings['video_letterbox'], 0, run_settings['video_letterbox'])
+        if path_video:
+            from getclips import get_duration
+            list_results += bench_detect_letter_box(path_video, crop_expected)
+            duration = get_duration(path_video)
+            scene_list = scene_grid(duration, run_settings['num_scenes'], run_settings['scene_length'])
+            for profile in run_settings['profile'].split(","):
+                list_results += bench_get_clips(path_video, scene_list, profile, run_settings['clip_batch_size'],
+                                                run_settings['clip_batch_gap'], run_settings['encode_workers'])
+
+    num_regressions = 0
+    if len(run_settings['path_baseline']):
+        num_regressions = compare_baseline(list_results, run_settings['path_baseline'], run_settings['regression_ratio'])
+    for result in list_results:
+        logger.info(f"[{result_key(result).rstrip('/')}] {result['seconds']:.3f}s for {result['written']} results" \
+                    + (f" (match: {result['match']})" if "match" in result else "") \
+                    + (f" (table: {result['table_mb']:.1f}MB, RSS: {result['rss_mb']:.1f}MB, peak RSS: {result['peak_rss_mb']:.1f}MB)" if "peak_rss_mb" in result else "") \
+                    + (f" ({result['ratio']:.2f}x baseline)" if "ratio" in result else ""))
+    if len(run_settings['path_baseline']):
+        logger.info(f"{num_regressions} regressions versus '{run_settings['path_baseline']}'")
+
+    if len(run_settings['path_output']):
+        import _version
+        with open(run_settings['path_output'], 'wt') as f:
+            json.dump({"version": _version.version()['version'], "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "settings": run_settings, "results": list_results}, f)
+    return list_results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import traceback
+import socketserver
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from main import clip, clip_parser
+from batch import row_args
+from getclips import encode_pool_start, encode_pool_stop
+import event_retrieval
+import event_index
+import mediainfo
+from media_runner import TIMEOUT_ENV
+
+import logging
+
+logger = logging.getLogger()
+
+JOBS_KEPT = 1000   # finished jobs remembered for GET /jobs/<id>
+# clip() imports its stages lazily; the daemon imports them up front so that pandas, numpy, and the
+# metadata parser registry load once, before the first job, and the encode pool workers fork with them
+WARM_MODULES = [event_retrieval, event_index, mediainfo]
+
+
+class ClipDaemon():
+    """Runs clip() jobs one at a time in this warm process (clip() keeps per-run state such as its metrics);
+    each job keeps a list of status events that request handlers stream back as they are added"""
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.jobs = {}   # id -> job, in submission order
+        self.queue = queue.Queue()
+        self.count = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, params):
+        """Queue a job from a dict of clip() options (as in input_params or a batch manifest row), with
+        an optional 'args' list of command-line arguments; bad options raise ValueError before queueing"""
+        params = dict(params)
+        list_args = [str(x) for x in params.pop("args", [])]
+        list_args += row_args(params, clip_parser())
+        try:
+            clip_parser().parse_args(list_args)
+        except SystemExit:   # argparse has logged why to stderr
+            raise ValueError(f"invalid clip options {list_args}")
+        with self.lock:
+            self.count += 1
+            job = {"id": self.count, "args": list_args, "status": "queued", "events": [], "submitted": str(datetime.now())}
+            self.jobs[job["id"]] = job
+            while len(self.jobs) > JOBS_KEPT and next(iter(self.jobs.values()))["status"] in ("done", "error"):
+                self.jobs.pop(next(iter(self.jobs)))
+            self.event(job, "queued", position=self.queue.qsize())
+        self.queue.put(job)
+        return job
+
+    def event(self, job, status, **kwargs):
+        """Record a status event of a job and wake its listeners (called with the lock held)"""
+        job["status"] = status
+        job["events"].append(dict({"job": job["id"], "status": status, "timestamp": str(datetime.now())}, **kwargs))
+        self.lock.notify_all()
+
+    def events(self, job, timeout=None):
+        """Yield a job's status events as they happen, ending with its final 'done' or 'error'"""
+        idx = 0
+        while True:
+            with self.lock:
+                while idx == len(job["events"]):
+                    if not self.lock.wait(timeout):
+                        return
+                list_new = job["events"][idx:]
+            idx += len(list_new)
+            for event in list_new:
+                yield event
+                if event["status"] in ("done", "error"):
+                    return
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                self.event(job, "running")
+            level, timeout = logger.level, os.environ.get(TIMEOUT_ENV)
+            time_start = time.monotonic()
+            try:
+                dict_result = clip(args=job["args"], download=False)
+                with self.lock:
+                    if dict_result is None:
+                        self.event(job, "error", error="clip() returned no result (e.g. an unknown profile or no scenes)",
+                                   seconds=time.monotonic() - time_start)
+                    else:
+                        self.event(job, "done", result=dict_result, seconds=time.monotonic() - time_start)
+            except (Exception, SystemExit) as err:
+                logger.error(f"daemon job {job['id']} failed: {err}")
+                logger.debug(traceback.format_exc())
+                with self.lock:
+                    self.event(job, "error", error=f"{type(err).__name__}: {err}", seconds=time.monotonic() - time_start)
+            finally:   # the next job starts from the daemon's own settings
+                logger.setLevel(level)
+                if timeout is None:
+                    os.environ.pop(TIMEOUT_ENV, None)
+                else:
+                    os.environ[TIMEOUT_ENV] = timeout
+
+    def stop(self):
+        self.queue.put(None)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """POST /jobs (JSON options) streams newline-delimited JSON status events until the job's result;
+    with ?wait=0 only the 'queued' event is returned; GET /jobs/<id> and GET /jobs report status"""
+    daemon = None   # set on the server's handler class
+
+    def reply(self, code, body):
+        data = (json.dumps(body) + "\n").encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path in ("", "/health"):
+            self.reply(200, {"status": "ok", "queued": self.daemon.queue.qsize(), "pid": os.getpid()})
+        elif path == "/jobs":
+            with self.daemon.lock:
+                self.reply(200, [{k: v for k, v in x.items() if k != "events"} for x in self.daemon.jobs.values()])
+        elif path.startswith("/jobs/") and path[6:].isdigit() and int(path[6:]) in self.daemon.jobs:
+            with self.daemon.lock:
+                job = self.daemon.jobs[int(path[6:])]
+                self.reply(200, dict({k: v for k, v in job.items() if k != "events"}, last=job["events"][-1]))
+        else:
+            self.reply(404, {"error": f"unknown path '{path}'"})
+
+    def do_POST(self):
+        path, _, query = self.path.partition("?")
+        if path.rstrip("/") != "/jobs":
+            self.reply(404, {"error": f"unknown path '{path}'"})
+            return
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if type(params) != dict:
+                raise ValueError("expected a JSON object of clip options")
+            job = self.daemon.submit(params)
+        except Exception as err:
+            self.reply(400, {"status": "error", "error": f"{type(err).__name__}: {err}"})
+            return
+        if "wait=0" in query.split("&"):
+            self.reply(202, job["events"][0])
+            return
+        self.send_response(200)   # HTTP/1.0, so the stream simply ends with the connection
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for event in self.daemon.events(job):
+                self.wfile.write((json.dumps(event) + "\n").encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):   # the client left; the job still finishes
+            pass
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        logger.info(f"daemon {self.address_string()}: {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):   # left by an earlier daemon
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+
+
+def serve(host="127.0.0.1", port=8421, path_socket="", encode_workers=0):
+    """Serve jobs over HTTP on host:port, or on a Unix socket (HTTP as well, e.g. curl --unix-socket)"""
+    logger.info(f"Clip daemon {os.getpid()} warm with {', '.join([x.__name__ for x in WARM_MODULES])}")
+    encode_pool_start(encode_workers)   # before any threads, so its workers fork cleanly
+    handler = type("Handler", (DaemonHandler,), {"daemon": ClipDaemon()})
+    if len(path_socket):
+        server = UnixHTTPServer(path_socket, handler)
+        logger.info(f"Clip daemon {os.getpid()} listening on unix socket '{path_socket}'")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        logger.info(f"Clip daemon {os.getpid()} listening on http://{host}:{server.server_address[1]}")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        handler.daemon.stop()
+        encode_pool_stop()
+        if len(path_socket) and os.path.exists(path_socket):
+            os.remove(path_socket)
+
+
+def main_daemon(args=None):
+    parser = argparse.ArgumentParser(description="""Keep the clip extractor warm and run jobs submitted locally...""",
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog="""
+        Jobs take the same options as main.py (or its input_params) as a JSON object, plus an optional
+        'args' list of command-line arguments; status events and the final data.json result stream back, e.g.
+
+            python daemon.py --port 8421 --encode_workers 4
+            curl -d '{"path_content": "videos/a.mp4", "clip_bounds": [15, -15], "profile": "popcorn"}' localhost:8421/jobs
+
+            python daemon.py --socket /tmp/clip_extractor.sock
+            curl --unix-socket /tmp/clip_extractor.sock -d '{"path_content": "videos/a.mp4"}' 'http://localhost/jobs?wait=0'
+        """)
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='HTTP address to listen on (default %(default)s)')
+    parser.add_argument('--port', type=int, default=8421, help='HTTP port to listen on (0=any free port, default %(default)s)')
+    parser.add_argument('--socket', type=str, default='', help='listen on this Unix socket instead of HTTP host and port')
+    parser.add_argument('--encode_workers', type=int, default=0, help='encode pool kept for all jobs (jobs asking for encode_workers > 1 share it, 0=none, default %(default)s)')
+    run_settings = parser.parse_args(args)
+    serve(run_settings.host, run_settings.port, run_settings.socket, run_settings.encode_workers)
+
+
+if __name__ == "__main__":
+    main_daemon()
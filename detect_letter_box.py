@@ -1,17 +1,32 @@
 import sys
 import os
-import subprocess
-import json
+import asyncio
+from collections import namedtuple
 import numpy as np
 
+from mediainfo import probe
+from media_runner import MediaRunner, run_media, run_sync
+from metrics import metric_timed
+
+
+CropRecord = namedtuple("CropRecord", ["video_name", "crop_width", "crop_height", "crop_x", "crop_y",
+                                       "video_width", "video_height"])
+
+
+def crop_info(record):
+    """ffmpeg crop filter for a crop record"""
+    return f"crop={record.crop_width}:{record.crop_height}:{record.crop_x}:{record.crop_y}"
+
+
+def crop_line(record):
+    """Pipe-delimited line for a crop record, as read by filter.py, adjust_crop.py, and parallel_crop.py"""
+    return f"{record.video_name}|{crop_info(record)}|{record.video_width}|{record.video_height}|" \
+           f"{record.crop_width}|{record.crop_height}\n"
+
 
 def get_video_width_and_height(video_file):
-    cmd="ffprobe -v quiet -select_streams v:0  -print_format json -show_format -show_streams {}".format(video_file)
-    result = subprocess.check_output(cmd, shell=True)
-    rec = json.loads(result)
-    width = rec["streams"][0]["width"]
-    height= rec["streams"][0]["height"]
-    return width, height
+    info = probe(video_file)
+    return info.width, info.height
 
 
 def get_new_frame_height_width(crop_str):
@@ -57,29 +72,161 @@ def estimate_cropped_height_and_width(ffmpeg_crop_msgs):
 def sample_letter_box(path_source):
     #detect the crop in the first 2 minutes
     cmd_list = ["ffmpeg", "-ss", "0", "-i", path_source, "-t", "120", "-vf", "fps=2,cropdetect", "-f", "null", "-"]
-
-    # res = subprocess.check_output(" ".join(cmd_list), shell=True, universal_newlines=True)
-    # modified for subprocess - https://stackoverflow.com/a/16516701 (5/27)
-    proc = subprocess.Popen(cmd_list, shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    result = run_media(cmd_list, stdout=False, stderr=True)
     list_results = []
-
-    # Read line from stdout, break if EOF reached, append line to output
-    for line in proc.stdout:
-        line = line.decode().strip()
+    for line in result.stderr.decode(errors="ignore").replace("\r", "\n").split("\n"):
+        line = line.strip()
         if "crop" in line:
             line_parts = line.split(" ")
             list_results.append(line_parts[-1])
     return list_results
 
 
-def detect_letter_box(list_sources, path_result=None):
-    """list of sources, list of results (or output path); future may change this to dataframe?"""
+async def sample_letter_box_point_async(runner, path_source, time_point, num_frames=4, scale=None):
+    """Detect the crop near one point from keyframes only, optionally downscaled; crops are in source pixels"""
+    filter_str = "cropdetect"
+    if scale is not None:   # detect on a small frame, then map back to the source size
+        filter_str = f"scale={scale[0]}:{scale[1]},cropdetect=round=2"
+    cmd_list = ["ffmpeg", "-skip_frame", "nokey", "-ss", str(time_point), "-i", path_source,
+                "-frames:v", str(num_frames), "-vf", filter_str, "-an", "-f", "null", "-"]
+    result = await runner.run(cmd_list, stdout=False, stderr=True)
+    list_results = []
+    for line in result.stderr.decode(errors="ignore").replace("\r", "\n").split("\n"):
+        line_parts = line.strip().split(" ")
+        if not line_parts[-1].startswith("crop="):
+            continue
+        if scale is None:
+            list_results.append(line_parts[-1])
+            continue
+        width, height, x, y = get_new_frame_height_width(line_parts[-1])
+        width, x = [int(round(v * scale[2] / 2)) * 2 for v in (width, x)]
+        height, y = [int(round(v * scale[3] / 2)) * 2 for v in (height, y)]
+        list_results.append(f"crop={width}:{height}:{x}:{y}")
+    return list_results
+
+
+def sample_letter_box_point(path_source, time_point, num_frames=4, scale=None):
+    return run_sync(sample_letter_box_point_async(MediaRunner(), path_source, time_point, num_frames, scale))
+
+
+def sample_points(duration, num_samples):
+    """Evenly spaced points, visited coarse-to-fine (0, 1/2, 1/4, 3/4, ...) so an early stop still covers the whole duration"""
+    def spread(idx):
+        return int(format(idx, "016b")[::-1], 2)
+    return [(idx + 0.5) * duration / num_samples for idx in sorted(range(num_samples), key=spread)]
+
+
+def sample_letter_box_sparse(path_source, num_samples=12, num_stable=3, num_workers=4, scale_height=180, num_frames=4):
+    """Sample keyframes at points spread over the whole video, stopping once the median crop is stable"""
+    info = probe(path_source)
+    if info is None or info.duration <= 0 or info.height <= 0:
+        return sample_letter_box(path_source)
+    scale = None
+    if info.height > scale_height:
+        scale_width = max(2, int(round(info.width * scale_height / info.height / 2)) * 2)
+        scale = (scale_width, scale_height, info.width / scale_width, info.height / scale_height)
+
+    list_points = sample_points(info.duration, num_samples)
+
+    async def sample_all():
+        runner = MediaRunner(max(1, num_workers))
+        list_tasks = [asyncio.ensure_future(sample_letter_box_point_async(runner, path_source, time_point, num_frames, scale))
+                      for time_point in list_points]
+        list_results = []
+        crop_last = None
+        count_stable = 0
+        try:
+            for task in list_tasks:   # in point order, so the early stop doesn't depend on timing
+                list_results += await task
+                crop_now = estimate_cropped_height_and_width(list_results)
+                count_stable = count_stable + 1 if crop_now == crop_last and crop_now[0] > 0 else 0
+                crop_last = crop_now
+                if count_stable >= num_stable:
+                    break
+        finally:   # stop points still running (their ffmpeg is killed) or waiting
+            for task in list_tasks:
+                task.cancel()
+            await asyncio.gather(*list_tasks, return_exceptions=True)
+        return list_results
+    return run_sync(sample_all())
+
+
+async def read_gray_frames_async(runner, path_source, time_point, buffer):
+    """Decode keyframes near a point as small grayscale frames into a (frames, height, width) uint8 buffer"""
+    num_frames, height, width = buffer.shape
+    cmd_list = ["ffmpeg", "-v", "quiet", "-skip_frame", "nokey", "-ss", str(time_point), "-i", path_source,
+                "-frames:v", str(num_frames), "-vf", f"scale={width}:{height},format=gray", "-an",
+                "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+    result = await runner.run(cmd_list, into=buffer)   # streamed straight into the caller's frames
+    return result.num_read // (height * width)   # complete frames read
+
+
+def read_gray_frames(path_source, time_point, buffer):
+    return run_sync(read_gray_frames_async(MediaRunner(), path_source, time_point, buffer))
+
+
+def crop_from_frames(stack, limit=24, frame_ok=None, num_group=1):
+    """Median crop (width, height, x, y) of non-black rows and columns; like cropdetect, the crop of each
+    group of consecutive frames (e.g. one sample point) is the union over its frames"""
+    rows = stack.mean(axis=2) > limit    # (frames, height) rows brighter than the black limit
+    cols = stack.mean(axis=1) > limit    # (frames, width)
+    if frame_ok is not None:
+        rows &= frame_ok[:, np.newaxis]
+        cols &= frame_ok[:, np.newaxis]
+    rows = rows.reshape(-1, num_group, rows.shape[1]).any(axis=1)
+    cols = cols.reshape(-1, num_group, cols.shape[1]).any(axis=1)
+    valid = rows.any(axis=1) & cols.any(axis=1)
+    if not valid.any():
+        return 0, 0, 0, 0
+    rows = rows[valid]
+    cols = cols[valid]
+    y1 = rows.argmax(axis=1)
+    y2 = rows.shape[1] - 1 - rows[:, ::-1].argmax(axis=1)
+    x1 = cols.argmax(axis=1)
+    x2 = cols.shape[1] - 1 - cols[:, ::-1].argmax(axis=1)
+    return int(np.median(x2 - x1 + 1)), int(np.median(y2 - y1 + 1)), int(np.median(x1)), int(np.median(y1))
+
+
+def sample_letter_box_frames(path_source, num_samples=12, num_workers=4, scale_height=180, num_frames=2, limit=24):
+    """Crop detection over raw grayscale keyframes spread over the video (no cropdetect text); source pixels"""
+    info = probe(path_source)
+    if info is None or info.duration <= 0 or info.height <= 0:
+        return 0, 0, 0, 0
+    height = min(scale_height, info.height)
+    width = max(2, int(round(info.width * height / info.height / 2)) * 2)
+
+    stack = np.zeros((num_samples * num_frames, height, width), dtype=np.uint8)
+    frame_ok = np.zeros(len(stack), dtype=bool)
+    async def read_all():
+        runner = MediaRunner(max(1, num_workers))
+        list_points = sample_points(info.duration, num_samples)
+        return await asyncio.gather(*[read_gray_frames_async(runner, path_source, list_points[idx],
+                                                             stack[idx * num_frames:(idx + 1) * num_frames])
+                                      for idx in range(num_samples)])
+    for idx, num_read in enumerate(run_sync(read_all())):
+        frame_ok[idx * num_frames:idx * num_frames + num_read] = True
+
+    crop_width, crop_height, crop_x, crop_y = crop_from_frames(stack, limit, frame_ok, num_frames)
+    if crop_width == 0:
+        return 0, 0, 0, 0
+    scale_x = info.width / width
+    scale_y = info.height / height
+    crop_width, crop_x = [int(round(v * scale_x / 2)) * 2 for v in (crop_width, crop_x)]
+    crop_height, crop_y = [int(round(v * scale_y / 2)) * 2 for v in (crop_height, crop_y)]
+    return min(crop_width, info.width), min(crop_height, info.height), crop_x, crop_y
+
+
+@metric_timed("detect_letter_box")
+def detect_letter_box(list_sources, path_result=None, sample_mode="head", return_records=False):
+    """list of sources, list of results (or output path); future may change this to dataframe?
+    sample_mode 'head' scans the first two minutes, 'sparse' samples keyframes across the whole video,
+    'frames' measures raw keyframes with numpy; return_records gives CropRecord tuples instead of lines"""
     list_result = []
     str_header = "video_name|crop_info|video_width|video_height|cropped_frame_width|cropped_frame_height\n"
     if path_result is not None:
         o_f = open(path_result, 'wt')
         o_f.write(str_header)
-    else:
+    elif not return_records:
         list_result.append(str_header)
 
     for line in list_sources:
@@ -89,18 +236,25 @@ def detect_letter_box(list_sources, path_result=None):
         video_width, video_height = get_video_width_and_height(video_file)
         # cmd = "sh cropdetect.sh {}".format(video_file)
         # result = subprocess.check_output(cmd, shell=True, universal_newlines=True)
-        result = sample_letter_box(video_file)
-        new_frame_width, new_frame_height, x, y = estimate_cropped_height_and_width(result)
+        if sample_mode == "frames":
+            new_frame_width, new_frame_height, x, y = sample_letter_box_frames(video_file)
+        else:
+            if sample_mode == "sparse":
+                result = sample_letter_box_sparse(video_file)
+            else:
+                result = sample_letter_box(video_file)
+            new_frame_width, new_frame_height, x, y = estimate_cropped_height_and_width(result)
         if new_frame_width == 0:
             continue
         
-        crop_str = 'crop={}:{}:{}:{}'.format(new_frame_width, new_frame_height, x, y)
-        str_result = '{video_file}|{crop_str}|{video_width}|{video_height}|{new_frame_width}|{new_frame_height}\n'.format(**locals())
+        record = CropRecord(video_file, new_frame_width, new_frame_height, x, y, video_width, video_height)
         if path_result is not None:
-            o_f.write(str_result)
+            o_f.write(crop_line(record))
             o_f.flush()
+        elif return_records:
+            list_result.append(record)
         else:
-            list_result.append(str_result)
+            list_result.append(crop_line(record))
 
     if path_result is None:
         return list_result
@@ -108,5 +262,5 @@ def detect_letter_box(list_sources, path_result=None):
 
 
 if __name__ == '__main__':
-    detect_letter_box(sys.stdin, sys.argv[1])
+    detect_letter_box(sys.stdin, sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "head")
 
@@ -0,0 +1,112 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+
+class EventIndex():
+    """Event table of one asset with sorted begin/end arrays, built once per table and shared by the
+    queries made on it (e.g. the begin and end searches of an alignment, or overlap lookups); filtered
+    subsets, sort orders, and group codes are cached"""
+
+    def __init__(self, df):
+        if isinstance(df, EventIndex):
+            df = df.df
+        self.df = pd.DataFrame([], columns=["time_begin", "time_end", "score"]) if df is None else df.reset_index(drop=True)
+        self._sorted = {}     # field -> frame sorted by that field
+        self._subsets = {}    # filter arguments -> EventIndex
+        self._codes = {}      # group columns -> group code per row
+        self._overlap = None  # (sorted begins, running max of their ends)
+
+    def __len__(self):
+        return len(self.df)
+
+    def sorted_by(self, field):
+        """Frame sorted by 'time_begin' or 'time_end' (same order as df.sort_values)"""
+        if field not in self._sorted:
+            self._sorted[field] = self.df.sort_values(field)
+        return self._sorted[field]
+
+    def sorted_values(self, field):
+        return self.sorted_by(field)[field].values
+
+    def subset(self, score_threshold=None, tag_type=None, extractor=None, tag=None):
+        """Events with score >= score_threshold and matching tag_type, extractor, and tag (a value or list)"""
+        def normalize(value):
+            if value is None:
+                return None
+            return tuple(value) if type(value) in (list, tuple, set) else (value,)
+        key = (score_threshold, normalize(tag_type), normalize(extractor), normalize(tag))
+        if key == (None, None, None, None):
+            return self
+        if key not in self._subsets:
+            mask = np.ones(len(self.df), dtype=bool)
+            if score_threshold is not None:
+                mask &= (self.df["score"] >= score_threshold).values
+            for col, values in zip(["tag_type", "extractor", "tag"], key[1:]):
+                if values is not None:
+                    mask &= self.df[col].isin(values).values
+            self._subsets[key] = EventIndex(self.df[mask])
+        return self._subsets[key]
+
+    def group_codes(self, list_col_group):
+        """Group number of every row (as groupby(...).ngroup(), -1 for rows with missing keys)"""
+        key = tuple(list_col_group)
+        if key not in self._codes:
+            df_group = self.df[list_col_group]
+            for col in list_col_group:   # categoricals group by their sorted category rank, like plain strings
+                if isinstance(df_group[col].dtype, pd.CategoricalDtype):
+                    categories = df_group[col].cat.categories
+                    rank = np.empty(len(categories), dtype=np.float64)
+                    rank[np.argsort(categories.values)] = np.arange(len(categories))
+                    codes = df_group[col].cat.codes.values
+                    df_group = df_group.assign(**{col: np.where(codes >= 0, rank[codes], np.nan)})
+            codes = df_group.groupby(list_col_group, sort=True).ngroup()
+            self._codes[key] = np.where(codes.notna() & (codes >= 0), codes, -1).astype(np.int64)
+        return self._codes[key]
+
+    def before(self, time_point, field="time_begin", side="left"):
+        """Position in sorted_by(field) of the nearest boundary before each time (-1 if none)"""
+        return np.searchsorted(self.sorted_values(field), time_point, side=side) - 1
+
+    def after(self, time_point, field="time_end", side="right"):
+        """Position in sorted_by(field) of the nearest boundary after each time (len if none)"""
+        return np.searchsorted(self.sorted_values(field), time_point, side=side)
+
+    def overlapping(self, time_begin, time_end):
+        """Events overlapping [time_begin, time_end] in begin order, found with two binary searches: over the
+        sorted begins (later events begin too late) and the running maximum of their ends (earlier events
+        all end too early); only the rows in between are checked one by one"""
+        if self._overlap is None:
+            df_sorted = self.sorted_by("time_begin")
+            ends = df_sorted["time_end"].values.astype(np.float64)
+            self._overlap = (df_sorted["time_begin"].values.astype(np.float64),
+                             np.fmax.accumulate(ends) if len(ends) else np.zeros(0))
+        begins, ends_max = self._overlap
+        idx_stop = np.searchsorted(begins, time_end, side="right")
+        idx_start = np.searchsorted(ends_max[:idx_stop], time_begin, side="left")
+        df_sorted = self.sorted_by("time_begin").iloc[idx_start:idx_stop]
+        return df_sorted[df_sorted["time_end"].values >= time_begin]
+
+
+def event_index(df):
+    """EventIndex for a table, reusing (and keeping the caches of) one that is already built"""
+    return df if isinstance(df, EventIndex) else EventIndex(df)
@@ -25,6 +25,7 @@ from datetime import datetime
 import json
 import bisect
 import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
@@ -35,6 +36,10 @@ logger = logging.getLogger()
 from contentai_metadata_flatten.parsers import get_by_type as parser_get_by_type  # parse other extractor inputs
 from contentai_metadata_flatten.parsers import empty_dataframe
 
+from metadata_cache import metadata_states, metadata_load, metadata_store
+from event_index import EventIndex, event_index
+from metrics import metric_timed
+
 
 def load_scenes(path_scenes, dir_content=None, parser_type=None, verbose=False):
     path_scenes = Path(path_scenes).resolve()   # file containing list of scenes e.g. 0,100\n 100,200\n etc
@@ -62,7 +67,49 @@ def load_scenes(path_scenes, dir_content=None, parser_type=None, verbose=False):
     return pd.DataFrame(scenes, columns=["time_begin", "time_end"])
 
 
-def parse_results(dir_content, parser_type, verbose=False, extractor_list=None):
+EVENT_COLUMNS = ["time_begin", "time_end", "time_event", "tag", "tag_type", "source_event", "score", "extractor"]
+EVENT_CATEGORIES = ["tag", "tag_type", "source_event", "extractor"]
+EVENT_FLOATS = ["time_begin", "time_end", "time_event", "score"]
+
+
+def compact_events(df):
+    """Event table with only the columns the clip pipeline reads, categorical strings, and float32 times and scores"""
+    if df is None:
+        return None
+    df = df[[x for x in EVENT_COLUMNS if x in df.columns]]
+    return df.astype({**{x: "category" for x in EVENT_CATEGORIES if x in df.columns},
+                      **{x: np.float32 for x in EVENT_FLOATS if x in df.columns}})
+
+
+def concat_events(list_df):
+    """Concatenate event tables, keeping categorical columns categorical (pandas falls back to object
+    when the categories differ)"""
+    list_df = list(list_df)
+    for col in EVENT_CATEGORIES:
+        list_cat = [x[col] for x in list_df if col in x.columns and isinstance(x[col].dtype, pd.CategoricalDtype)]
+        if len(list_cat) < 2:
+            continue
+        categories = sorted(set().union(*[x.cat.categories for x in list_cat]))
+        list_df = [x.astype({col: pd.CategoricalDtype(categories)}) if col in x.columns else x for x in list_df]
+    return pd.concat(list_df, sort=False)
+
+
+def parse_parser(parse_job):
+    """Run one discovered parser over a metadata directory (a pool worker); returns its full table or None,
+    compacted in the worker so that only the small table is kept (or sent back from a process)"""
+    dir_content, parser_obj, verbose, compact = parse_job
+    parser_instance = parser_obj['obj'](dir_content, logger=logger)   # create instance
+    df = parser_instance.parse({"verbose": verbose})  # attempt to process
+    return compact_events(df) if compact else df
+
+
+@metric_timed("parse_results")
+def parse_results(dir_content, parser_type, verbose=False, extractor_list=None, use_cache=True,
+                  num_workers=1, pool_type="thread", compact=False, score_threshold=None):
+    """Events of the given tag types from every discovered parser; with num_workers > 1 the parsers
+    run concurrently on a 'thread' or 'process' pool (results keep the discovery order);
+    compact keeps each parser's table small (see compact_events) and filters it by tag type and
+    score_threshold (if given) as soon as it is read"""
     if type(parser_type) is str:
         parser_type = [parser_type]
     path_content = Path(dir_content)
@@ -93,24 +140,43 @@ def parse_results(dir_content, parser_type, verbose=False, extractor_list=None):
             list_parser_modules |= set([x for x in list_parser_modules if extractor in x["name"]])
         list_parser_modules = list(list_parser_modules)
     
-    df_return = empty_dataframe()
-    for parser_obj in list_parser_modules:  # iterate through auto-discovered packages
-        parser_instance = parser_obj['obj'](dir_content, logger=logger)   # create instance
-        df = parser_instance.parse({"verbose": verbose})  # attempt to process
+    dict_states = metadata_states(dir_content, list_parser_modules) if use_cache else {}
+    list_states = [dict_states.get(x['name']) for x in list_parser_modules]   # each parser keyed on its own inputs
+    list_names = [x['name'] + ("-compact" if compact else "") for x in list_parser_modules]   # cached separately
+    list_df = [metadata_load(dir_content, list_states[idx], list_names[idx]) if use_cache else None for idx in range(len(list_names))]
+    list_jobs = [(dir_content, list_parser_modules[idx], verbose, compact) for idx in range(len(list_df)) if list_df[idx] is None]
+    if num_workers > 1 and len(list_jobs) > 1:
+        pool_class = ProcessPoolExecutor if pool_type == "process" else ThreadPoolExecutor
+        with pool_class(max_workers=min(num_workers, len(list_jobs))) as executor:
+            list_parsed = list(executor.map(parse_parser, list_jobs))
+    else:
+        list_parsed = [parse_parser(x) for x in list_jobs]
+    iter_parsed = iter(list_parsed)
+    for idx in range(len(list_df)):   # fill in the freshly parsed tables, in discovery order
+        if list_df[idx] is None:
+            df = next(iter_parsed)
+            if use_cache:   # cache the full table (all tag types), also when nothing was found
+                df = metadata_store(dir_content, list_states[idx], list_names[idx],
+                                    df if df is not None else empty_dataframe())
+            list_df[idx] = df
+
+    list_return = [empty_dataframe()]
+    for df in list_df:  # iterate through auto-discovered packages
         if df is not None:
             df = df[df["tag_type"].isin(parser_type)]   # subselect only shots
             if len(parser_sub_incl):    # subselect type within a tag
                 df = df[df["tag"].str.contains(parser_sub_incl)]
             if len(parser_sub_excl):    # exclude type within a tag
                 df = df[~df["tag"].str.contains(parser_sub_excl)]
+            if score_threshold is not None:
+                df = df[df["score"] >= score_threshold]
         if df is not None and len(df):
             if verbose:
                 logger.critical(f"Found  {len(df)} shots with total duration {df['time_end'].max()}...")
-            df.reset_index(drop=True, inplace=True)   # drop other index for straight number
-            if df_return is None:
-                df_return = df
-            else:
-                df_return = df_return.append(df, ignore_index=False, sort=False)
+            list_return.append(df.reset_index(drop=True))   # drop other index for straight number
+    if compact:
+        list_return[0] = compact_events(list_return[0])
+    df_return = concat_events(list_return) if len(list_return) > 1 else list_return[0]
     if not len(df_return):
         logger.critical(f"Could not find shots from extractors {[x['name'] for x in list_parser_modules]}, aborting.")
     return df_return
@@ -136,7 +202,103 @@ def rle(inarray):
         return(z, p, ia[i])
 
 
-def event_rle(df, score_threshold=0.8, duration_threshold=10, duration_expand=3, peak_method='rle', max_duration=-1):
+@metric_timed("event_rle")
+def event_rle(df, score_threshold=0.8, duration_threshold=10, duration_expand=3, peak_method='rle', max_duration=-1, engine='numpy'):
+    """Find scenes as runs of high-scoring events for each (tag, source_event, tag_type) group.
+    engine 'numpy' bins all groups at once, 'pandas' is the original per-group resampling (same results);
+    df may be a DataFrame or an EventIndex"""
+    if engine == 'pandas':
+        if isinstance(df, EventIndex):
+            df = df.df
+        if df is not None:   # group in the same order as the plain string columns
+            df = df.astype({x: object for x in df.columns if isinstance(df[x].dtype, pd.CategoricalDtype)})
+        return event_rle_pandas(df, score_threshold, duration_threshold, duration_expand, peak_method, max_duration)
+    return event_rle_numpy(df, score_threshold, duration_threshold, duration_expand, peak_method, max_duration)
+
+
+def event_rle_numpy(df, score_threshold=0.8, duration_threshold=10, duration_expand=3, peak_method='rle', max_duration=-1):
+    """Vectorized event_rle: every group is binned into fixed-width buckets with group code x bucket index
+    arrays, matching the two resample passes of event_rle_pandas (mean over half-width bins, then every
+    other bin is kept and empty bins become zero) without per-group pandas calls"""
+    if df is None:
+        return None
+    list_col_group = ["tag", "source_event", "tag_type"]
+    list_col_out = ["time_begin", "time_end", "score"] + list_col_group
+    if peak_method != 'rle':
+        logger.error(f"Error: Unknown peak-detection method {peak_method}, aborting.")
+        return None
+    duration_threshold_count = math.floor(duration_threshold / duration_expand)
+
+    index = event_index(df)
+    group_code = index.group_codes(list_col_group)
+    group_ok = group_code >= 0   # groupby drops keys with missing values
+    df_valid = index.df[group_ok]
+    group_code = group_code[group_ok]
+    if not len(df_valid):
+        return pd.DataFrame([], columns=list_col_out)
+    num_groups = int(group_code.max()) + 1
+
+    # time in integer nanoseconds, as pd.Timedelta(x, unit='seconds') rounds it
+    time_sec = df_valid["time_begin"].values.astype(np.float64)
+    time_base = np.trunc(time_sec)
+    time_ns = time_base.astype(np.int64) * 1000000000 + (np.round(time_sec - time_base, 9) * 1e9).astype(np.int64)
+    half_ns = int(round(duration_expand / 2 * 1e9))
+    full_ns = int(round(duration_expand * 1e9))
+
+    # half-width bins start at each group's first event; only even bins survive the second (fill) resample
+    group_min = np.full(num_groups, np.iinfo(np.int64).max, dtype=np.int64)
+    group_max = np.full(num_groups, np.iinfo(np.int64).min, dtype=np.int64)
+    np.minimum.at(group_min, group_code, time_ns)
+    np.maximum.at(group_max, group_code, time_ns)
+    group_size = (((group_max - group_min) // half_ns) * half_ns) // full_ns + 1   # output buckets per group
+    group_offset = np.concatenate([[0], np.cumsum(group_size)])
+    num_buckets = int(group_offset[-1])
+
+    bin_half = (time_ns - group_min[group_code]) // half_ns
+    bin_keep = bin_half % 2 == 0
+    bucket = group_offset[group_code[bin_keep]] + bin_half[bin_keep] // 2
+
+    def bucket_mean(col):   # mean per bucket, skipping missing values; empty buckets are zero
+        values = df_valid[col].values.astype(np.float64)[bin_keep]
+        values_ok = ~np.isnan(values)
+        total = np.bincount(bucket[values_ok], weights=values[values_ok], minlength=num_buckets)
+        count = np.bincount(bucket[values_ok], minlength=num_buckets)
+        return np.divide(total, count, out=np.zeros(num_buckets), where=count > 0)
+    bucket_begin = bucket_mean("time_begin")
+    bucket_end = bucket_mean("time_end")
+    bucket_score = bucket_mean("score")
+
+    # run-length encoding across all groups at once; a new run starts at every group boundary
+    mask = bucket_score > score_threshold
+    bucket_group = np.repeat(np.arange(num_groups), group_size)
+    run_start = np.ones(num_buckets, dtype=bool)
+    run_start[1:] = (mask[1:] != mask[:-1]) | (bucket_group[1:] != bucket_group[:-1])
+    run_pos = np.flatnonzero(run_start)
+    run_len = np.diff(np.append(run_pos, num_buckets))
+    run_group = bucket_group[run_pos]
+    run_last = run_pos + run_len == group_offset[run_group + 1]
+    run_keep = mask[run_pos] & (run_len >= duration_threshold_count)
+
+    run_pos = run_pos[run_keep]
+    run_group = run_group[run_keep]
+    # matching the original, the last run of a group ends one bucket early (and may wrap to the last bucket)
+    run_end = np.where(run_last[run_keep], group_offset[run_group + 1] - 1, run_pos + run_len[run_keep])
+    idx_end = run_end - 1
+    idx_end = np.where(idx_end < group_offset[run_group], group_offset[run_group + 1] - 1, idx_end)
+
+    score_cumsum = np.concatenate([[0.0], np.cumsum(bucket_score)])
+    run_count = run_end - run_pos
+    run_score = np.divide(score_cumsum[run_end] - score_cumsum[run_pos], run_count,
+                          out=np.full(len(run_pos), np.nan), where=run_count > 0)
+
+    df_segments = pd.DataFrame({"time_begin": bucket_begin[run_pos], "time_end": bucket_end[idx_end], "score": run_score})
+    df_keys = df_valid[list_col_group].iloc[np.unique(group_code, return_index=True)[1]]   # first row of each group
+    for col in list_col_group:
+        df_segments[col] = df_keys[col].values[run_group]
+    return df_segments.reset_index(drop=True)
+
+
+def event_rle_pandas(df, score_threshold=0.8, duration_threshold=10, duration_expand=3, peak_method='rle', max_duration=-1):
     # original source (has sample for each time interval in video)
     # HBO_20200227_170000_clip_00004  40.2523 9.7069  3600.642700     {"explosion": 0.00016436472414050305}
     # HBO_20200227_170000_clip_00005  49.9592 10.3402 3600.642700     {"explosion": 0.0011733169780347246}
@@ -199,6 +361,8 @@ def event_rle(df, score_threshold=0.8, duration_threshold=10, duration_expand=3,
         else:
             df_segments = df_segments.append(df_new, sort=False)
         # print(idx_g, duration_threshold, output)
+    if df_segments is None:   # no groups at all
+        return pd.DataFrame([], columns=["time_begin", "time_end", "score"] + list_col_group)
     return df_segments.reset_index(drop=True)
 
 
@@ -249,8 +413,122 @@ def event_search(row, df, max_duration, direction_earlier, df_fallback=None, all
     return time_return, event_return
 
 
+@metric_timed("event_alignment")
 def event_alignment(df_events, df_scenes, max_duration=-1, min_duration=-1, 
-                    df_events_fallback=None, score_threshold=0.5, allow_flip=True):
+                    df_events_fallback=None, score_threshold=0.5, allow_flip=True, engine='numpy'):
+    """Align scene boundaries to the nearest event begin (earlier) and end (later), with fallback events.
+    engine 'numpy' resolves all scenes with array searches, 'pandas' is the original per-scene search (same results);
+    the event tables may be DataFrames or EventIndex objects (their sorted subsets are reused across calls)"""
+    if engine == 'pandas':
+        if isinstance(df_events, EventIndex):
+            df_events = df_events.df
+        if isinstance(df_events_fallback, EventIndex):
+            df_events_fallback = df_events_fallback.df
+        return event_alignment_pandas(df_events, df_scenes, max_duration, min_duration,
+                                      df_events_fallback, score_threshold, allow_flip)
+    return event_alignment_numpy(df_events, df_scenes, max_duration, min_duration,
+                                 df_events_fallback, score_threshold, allow_flip)
+
+
+def event_search_numpy(time_begin, time_end, df, max_duration, direction_earlier, df_fallback=None, allow_flip=True):
+    """Vectorized event_search over all scenes; returns new times and (source, row) of the chosen events
+    where source is 0 for df, 1 for df_fallback, and -1 for no event"""
+    field_search, side_search, field_flip, side_flip = ('time_begin', 'left', 'time_end', 'right') if direction_earlier \
+                                                       else ('time_end', 'right', 'time_begin', 'left')
+    time_key = time_begin if direction_earlier else time_end
+    if direction_earlier:
+        time_return = np.zeros(len(time_key))
+    else:   # if going later, cap by max offset/duration
+        time_return = np.minimum(time_end, time_begin + max_duration) if max_duration > 0 else time_end.copy()
+    event_source = np.full(len(time_key), -1)
+    event_row = np.full(len(time_key), -1)
+
+    def search(values, keys, side, earlier, sorted_values=True):
+        if sorted_values:
+            idx = np.searchsorted(values, keys, side=side)
+        else:   # one search per key, as a batched search may narrow its bounds differently on unsorted values
+            idx = np.array([np.searchsorted(values, x, side=side) for x in keys], dtype=np.int64)
+        if earlier:
+            idx = idx - 1
+        return idx, (idx >= 0) & (idx < len(values))
+
+    values = df[field_search].values
+    idx, hit = search(values, time_key, side_search, direction_earlier)
+    time_return[hit] = values[idx[hit]]
+    event_source[hit] = 0
+    event_row[hit] = idx[hit]
+    miss = np.flatnonzero(~hit)
+    if not len(miss):
+        return time_return, event_source, event_row
+
+    # special logic to see if it's closer to search "inward": the scene collapses to its key and the
+    # opposite direction is searched, over the same frames (sorted by the other field, as in event_search)
+    if allow_flip:
+        time_return[miss] = time_key[miss] if direction_earlier else 0
+        values = df[field_flip].values
+        idx, hit = search(values, time_key[miss], side_flip, not direction_earlier, False)
+        time_return[miss[hit]] = values[idx[hit]]
+        event_source[miss[hit]] = 0
+        event_row[miss[hit]] = idx[hit]
+        if df_fallback is not None and (~hit).any():
+            miss_flip = miss[~hit]
+            values = df_fallback[field_flip].values
+            idx, hit = search(values, time_key[miss_flip], side_flip, not direction_earlier, False)
+            time_return[miss_flip[hit]] = values[idx[hit]]
+            event_source[miss_flip[hit]] = 1
+            event_row[miss_flip[hit]] = idx[hit]
+
+    if df_fallback is not None:   # utilize fallback if there (e.g. shots)
+        values = df_fallback[field_search].values
+        idx, hit = search(values, time_key[miss], side_search, direction_earlier)
+        if allow_flip:   # new fallback must be better than the flipped result
+            time_center = (time_begin[miss] + time_end[miss]) / 2
+            time_fallback = values[np.clip(idx, 0, max(len(values) - 1, 0))] if len(values) else np.zeros(len(miss))
+            hit &= np.abs(time_center - time_fallback) < np.abs(time_center - time_return[miss])
+        time_return[miss[hit]] = values[idx[hit]]
+        event_source[miss[hit]] = 1
+        event_row[miss[hit]] = idx[hit]
+    return time_return, event_source, event_row
+
+
+def event_alignment_numpy(df_events, df_scenes, max_duration=-1, min_duration=-1,
+                          df_events_fallback=None, score_threshold=0.5, allow_flip=True):
+    """Vectorized event_alignment: all scene begins and ends are searched at once and event
+    details are only looked up for the chosen rows at the end"""
+    index_sub = event_index(df_events).subset(score_threshold)
+    df_starts = index_sub.sorted_by('time_begin')       # start and stop must be sorted separately b/c of possible overlap
+    df_ends = index_sub.sorted_by('time_end')
+
+    df_starts_fallback = None
+    df_ends_fallback = None
+    if df_events_fallback is not None:
+        index_sub = event_index(df_events_fallback).subset(score_threshold)
+        df_starts_fallback = index_sub.sorted_by('time_begin')
+        df_ends_fallback = index_sub.sorted_by('time_end')
+    if not len(df_scenes):
+        return pd.DataFrame([])
+
+    time_begin = df_scenes['time_begin'].values.astype(np.float64)
+    time_end = df_scenes['time_end'].values.astype(np.float64)
+    df_return = df_scenes.copy()
+    for col_time, col_event, df_primary, df_fallback, direction_earlier in \
+            [('time_begin', 'event_begin', df_starts, df_starts_fallback, True),
+             ('time_end', 'event_end', df_ends, df_ends_fallback, False)]:
+        time_new, event_source, event_row = event_search_numpy(time_begin, time_end, df_primary, max_duration,
+                                                               direction_earlier, df_fallback, allow_flip)
+        list_events = [None] * len(df_scenes)
+        for source, df_source in [(0, df_primary), (1, df_fallback)]:
+            idx_scene = np.flatnonzero(event_source == source)
+            if len(idx_scene):   # save the event info
+                for idx, event in zip(idx_scene, df_source.iloc[event_row[idx_scene]].to_dict(orient='records')):
+                    list_events[idx] = event
+        df_return[col_time] = time_new
+        df_return[col_event] = list_events
+    return df_return
+
+
+def event_alignment_pandas(df_events, df_scenes, max_duration=-1, min_duration=-1,
+                           df_events_fallback=None, score_threshold=0.5, allow_flip=True):
     df_events_sub = df_events[df_events['score'] >= score_threshold]
     df_starts = df_events_sub.sort_values('time_begin')       # start and stop must be sorted separately b/c of possible overlap
     df_ends = df_events_sub.sort_values('time_end')
@@ -279,6 +557,23 @@ def event_alignment(df_events, df_scenes, max_duration=-1, min_duration=-1,
     return pd.DataFrame(list_return)
 
 
+def keyframe_snap(df_scenes, list_keyframes, min_duration=0):
+    """Move each scene begin forward to the first keyframe inside the scene so that a stream copy starts
+    exactly there (the end needs no keyframe); scenes without a keyframe inside, or that would become
+    shorter than min_duration, are left as they are"""
+    df_return = df_scenes.copy()
+    if list_keyframes is None or not len(list_keyframes) or not len(df_scenes):
+        return df_return
+    keyframes = np.asarray(list_keyframes, dtype=np.float64)
+    time_begin = df_scenes["time_begin"].values.astype(np.float64)
+    time_end = df_scenes["time_end"].values.astype(np.float64)
+    idx_begin = np.searchsorted(keyframes, time_begin, side="left")     # first keyframe at or after the begin
+    snap = idx_begin < len(keyframes)
+    snap[snap] = (keyframes[idx_begin[snap]] < time_end[snap]) & (time_end[snap] - keyframes[idx_begin[snap]] >= min_duration)
+    df_return.loc[snap, "time_begin"] = keyframes[idx_begin[snap]]
+    return df_return
+
+
 if __name__ == "__main__":
     # TODO: erase this when further developed
     path_execute = Path(__file__).parent
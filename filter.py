@@ -1,9 +1,19 @@
 import sys
 
+from detect_letter_box import CropRecord, crop_line
+
 def filter_crop_dims(list_cropped, threshold, return_list=True):
+    """filter pipe-delimited lines (with header) or CropRecord tuples (no header) to those cropping past threshold"""
     is_header = True
     list_results = []
     for line in list_cropped:
+        if isinstance(line, CropRecord):   # typed records need no parsing
+            if abs(line.video_width - line.crop_width) > threshold or abs(line.video_height - line.crop_height) > threshold:
+                if return_list:
+                    list_results.append(line)
+                else:
+                    print(crop_line(line).strip())
+            continue
         line = line.strip()
         if is_header:
             is_header = False
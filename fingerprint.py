@@ -0,0 +1,135 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import mmap
+import json
+import hashlib
+import tempfile
+import logging
+
+logger = logging.getLogger()
+
+FingerprintModes = ["full", "sampled"]
+
+_fingerprint_memory = {}   # stat key -> fingerprint, for this process
+
+
+def cache_dir():
+    """Directory for on-disk caches (override with CLIP_EXTRACTOR_CACHE, empty string disables)"""
+    path_cache = os.getenv("CLIP_EXTRACTOR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "clip_extractor"))
+    if not len(path_cache):
+        return None
+    try:
+        os.makedirs(path_cache, exist_ok=True)
+    except OSError as err:
+        logger.warning(f"cache_dir {path_cache}: {err}")
+        return None
+    return path_cache
+
+
+def cache_read(name):
+    """Read a JSON cache file by name, empty if missing or unreadable"""
+    path_cache = cache_dir()
+    if path_cache is None:
+        return {}
+    try:
+        with open(os.path.join(path_cache, name), 'rt') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def cache_write(name, dict_cache):
+    """Atomically replace a JSON cache file by name (safe for concurrent runs, last writer wins)"""
+    path_cache = cache_dir()
+    if path_cache is None:
+        return False
+    try:
+        fd, path_temp = tempfile.mkstemp(dir=path_cache, prefix=name, suffix=".tmp")
+        with os.fdopen(fd, 'wt') as f:
+            json.dump(dict_cache, f)
+        os.replace(path_temp, os.path.join(path_cache, name))
+    except OSError as err:
+        logger.warning(f"cache_write {name}: {err}")
+        return False
+    return True
+
+
+def stat_key(filename):
+    """Key that changes whenever the file is replaced or modified (device, inode, size, mtime)"""
+    st = os.stat(filename)
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def file_md5(filename, chunk_size=1 << 22):
+    """MD5 of the whole file (same digest as the original 64KB loop, just larger reads)"""
+    file_hash = hashlib.md5()
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if len(chunk) < 1:
+                break
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def file_sampled(filename, window=1 << 20):
+    """MD5 of the file size plus a head, middle, and tail window; small files are hashed whole"""
+    size = os.path.getsize(filename)
+    file_hash = hashlib.md5(str(size).encode())
+    if size <= window * 3:
+        with open(filename, "rb") as f:
+            file_hash.update(f.read())
+        return file_hash.hexdigest()
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in [0, (size - window) // 2, size - window]:
+                file_hash.update(mm[offset:offset + window])
+    return file_hash.hexdigest()
+
+
+def fingerprint(filename, mode="full", use_cache=True):
+    """Content fingerprint of a file; 'full' matches historical output directory names, 'sampled' is fast"""
+    if mode not in FingerprintModes:
+        raise ValueError(f"Unknown fingerprint mode '{mode}', expected one of {FingerprintModes}")
+    key = f"{mode}:{stat_key(filename)}"
+    if use_cache:
+        if key in _fingerprint_memory:
+            return _fingerprint_memory[key]
+        dict_cache = cache_read("fingerprint.json")
+        if key in dict_cache:
+            _fingerprint_memory[key] = dict_cache[key]
+            return dict_cache[key]
+
+    value = file_md5(filename) if mode == "full" else file_sampled(filename)
+    _fingerprint_memory[key] = value
+    if use_cache:
+        dict_cache = cache_read("fingerprint.json")   # re-read in case another run wrote meanwhile
+        dict_cache[key] = value
+        cache_write("fingerprint.json", dict_cache)
+    return value
+
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else "full"
+    for line in sys.stdin:
+        print(f"{line.strip()}\t{fingerprint(line.strip(), mode)}")
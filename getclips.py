@@ -1,13 +1,23 @@
 import os
+import shlex
+import tempfile
+import bisect
+import math
+import time
 import logging
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
-from parallel_crop import load_video_cropped_list
-from detect_letter_box import detect_letter_box 
-from adjust_crop import adjust_crop 
-from filter import filter_crop_dims
+from fingerprint import fingerprint, file_md5, cache_read, cache_write
+from mediainfo import probe, keyframe_index
+from media_runner import run_media, run_media_many, TIMEOUT_ENV
+from metrics import metrics, metric_timed, encode_record
 
 logger = logging.getLogger()
 
+CROP_VERSION = 1   # bump when crop detection changes so stored crops are found again
+
 ClipProfiles = {}
 ClipProfiles["none"]      = ""
 ClipProfiles["default"]   = "-y -c copy"
@@ -16,8 +26,12 @@ ClipProfiles["small"]     = "-y -vf yadif -c:v libx264 -refs 4 -b:v 2M -coder 1
 ClipProfiles["letterbox"] = "-y -vf yadif {} -c:v libx264 -refs 4 -b:v 5M -coder 1 -acodec aac -ac 2  -ar 44100  -ab 128k -f mp4"
 
 
-def find_crop_coordinates (filename):
-    list_crop = detect_letter_box([filename])
+def find_crop_coordinates (filename, sample_mode="sparse"):
+    from parallel_crop import load_video_cropped_list   # numpy, only needed by the letterbox profile
+    from detect_letter_box import detect_letter_box
+    from adjust_crop import adjust_crop
+    from filter import filter_crop_dims
+    list_crop = detect_letter_box([filename], sample_mode=sample_mode, return_records=True)
     list_crop_filter = filter_crop_dims(list_crop, 20)
     list_adjusted = adjust_crop(list_crop_filter)
     crop_info = load_video_cropped_list(list_adjusted)
@@ -26,11 +40,299 @@ def find_crop_coordinates (filename):
     return "-vf " + crop_info[0][1]
 
 
+def crop_coordinates (filename, hashed_name, sample_mode="sparse"):
+    """find_crop_coordinates, kept on disk by source fingerprint for later runs with other profiles"""
+    key = f"v{CROP_VERSION}:{hashed_name}:{sample_mode}"
+    dict_cache = cache_read("letterbox.json")
+    if key in dict_cache:
+        return dict_cache[key]
+    crop_str = find_crop_coordinates(filename, sample_mode)
+    dict_cache = cache_read("letterbox.json")   # re-read in case another run wrote meanwhile
+    dict_cache[key] = crop_str
+    cache_write("letterbox.json", dict_cache)
+    return crop_str
+
+
+def run_encode(cmd_list, clip, mode, duration, list_progress=None):
+    """Run one encode and record its clip stats from ffmpeg's '-progress' reports (or collect the
+    last report in list_progress to combine several encodes of one clip)"""
+    list_blocks = [{}]
+    def progress(block):
+        logger.debug (f"{mode} {clip}: {block.get('out_time', 0):.1f}/{duration:.1f}s ({block.get('speed', '')})")
+        list_blocks.append(block)
+    result = run_media(cmd_list, progress=progress)
+    if list_progress is not None:
+        list_progress.append(list_blocks[-1])
+    else:
+        metrics().encode_add(encode_record(clip, mode, result.seconds, list_blocks[-1], duration))
+    return result.returncode
+
+
+@metric_timed("video_cut")
 def video_cut (source, start, stop, dest, profile):
     dur = stop - start
-    cmd = f"ffmpeg -v quiet -ss {start} -i {source} -t {dur} {profile} {dest}"
-    #print (cmd)
-    return os.system(cmd)
+    cmd_list = ["ffmpeg", "-v", "quiet", "-ss", str(start), "-i", source, "-t", str(dur)] + shlex.split(profile) + [dest]
+    return run_encode(cmd_list, dest, "clip", dur)
+
+
+def profile_split(profile_str):
+    """Split a profile into its video filter and remaining output options; (None, None) if it can't be batched"""
+    tokens = shlex.split(profile_str)
+    filter_video = None
+    list_options = []
+    idx = 0
+    while idx < len(tokens):
+        token = tokens[idx]
+        token_next = tokens[idx + 1] if idx + 1 < len(tokens) else None
+        if token in ("-vf", "-filter:v") and token_next is not None:
+            filter_video = token_next   # ffmpeg only honors the last video filter given for an output
+            idx += 2
+            continue
+        if token in ("-c", "-codec", "-c:v", "-vcodec", "-codec:v", "-c:a", "-acodec", "-codec:a") and token_next == "copy":
+            return None, None   # stream copy can't go through a filter graph
+        if token != "-y":
+            list_options.append(token)
+        idx += 1
+    return filter_video, list_options
+
+
+def batch_scenes(scene_list, batch_size=8, batch_gap=10):
+    """Group scene indices that are close in time so that one decode pass can serve all of them"""
+    list_batches = []
+    batch = []
+    time_end = 0
+    for idx in sorted(range(len(scene_list)), key=lambda x: scene_list[x][0]):
+        start, stop = scene_list[idx]
+        if len(batch) and (len(batch) >= batch_size or start - time_end > batch_gap):
+            list_batches.append(batch)
+            batch = []
+        time_end = max(time_end, stop) if len(batch) else stop
+        batch.append(idx)
+    if len(batch):
+        list_batches.append(batch)
+    return list_batches
+
+
+def video_cut_batch (source, scene_list, dest_list, profile, has_audio=True, posn=1, num_threads=0, with_thumbs=True):
+    """Cut several clips (and their thumbnails) from one open and decode of the source; profile may also be
+    a list (a rendition ladder) with one dest per profile for each scene, all fed from the same decode"""
+    list_profiles = profile if type(profile) == list else [profile]
+    list_dests = [x if type(x) == list else [x] for x in dest_list]
+    list_split = [profile_split(x) for x in list_profiles]
+    if any([x[1] is None for x in list_split]):
+        return -1
+    list_filters = []   # each distinct profile filter runs once, then splits to its outputs
+    for filter_video, _ in list_split:
+        if filter_video not in list_filters:
+            list_filters.append(filter_video)
+    time_begin = min([x[0] for x in scene_list])
+    time_end = max([x[1] for x in scene_list])
+    num_scenes = len(scene_list)
+    num_outputs = num_scenes * len(list_profiles)
+    if num_threads > 0:   # the job's thread budget is shared by every encoder in this process
+        list_split = [(x[0], x[1] + ["-threads", str(max(1, num_threads // num_outputs))]) for x in list_split]
+
+    dict_labels = {idx: [] for idx in range(len(list_filters))}   # filter -> split outputs
+    def label(filter_video):
+        idx_filter = list_filters.index(filter_video)
+        dict_labels[idx_filter].append(f"vs{sum([len(x) for x in dict_labels.values()])}")
+        return dict_labels[idx_filter][-1]
+
+    list_graph = []
+    if has_audio:
+        list_graph.append(f"[0:a:0]asplit={num_outputs}" + "".join([f"[as{idx}]" for idx in range(num_outputs)]))
+    cmd_list = ["ffmpeg", "-v", "quiet", "-y", "-ss", str(time_begin), "-t", str(time_end - time_begin), "-i", source]
+    cmd_outputs = []
+    for idx in range(num_scenes):
+        start = scene_list[idx][0] - time_begin    # timestamps restart at zero after the input seek
+        stop = scene_list[idx][1] - time_begin
+        start_thumb = start + posn if start + posn < stop else start
+        for idx_profile, (filter_video, list_options) in enumerate(list_split):
+            name_out = f"{idx}" if idx_profile == 0 else f"{idx}_{idx_profile}"
+            list_graph.append(f"[{label(filter_video)}]trim=start={start}:end={stop},setpts=PTS-STARTPTS[v{name_out}]")
+            cmd_outputs += ["-map", f"[v{name_out}]"]
+            if has_audio:
+                idx_audio = idx * len(list_split) + idx_profile
+                list_graph.append(f"[as{idx_audio}]atrim=start={start}:end={stop},asetpts=PTS-STARTPTS[a{name_out}]")
+                cmd_outputs += ["-map", f"[a{name_out}]"]
+            cmd_outputs += list_options + [list_dests[idx][idx_profile]]
+            if idx_profile == 0 and with_thumbs:   # one thumbnail per scene, from the first rendition
+                list_graph.append(f"[{label(filter_video)}]trim=start={start_thumb}:end={stop},setpts=PTS-STARTPTS[t{idx}]")
+        if with_thumbs:
+            cmd_outputs += ["-map", f"[t{idx}]", "-frames:v", "1", "-q:v", "2", thumb(list_dests[idx][0])]
+
+    # decode once, apply each profile filter once, then split to each clip and thumbnail
+    list_decode = []
+    if len(list_filters) > 1:
+        list_decode.append(f"[0:v:0]split={len(list_filters)}" + "".join([f"[vf{idx}]" for idx in range(len(list_filters))]))
+    for idx_filter, filter_video in enumerate(list_filters):
+        input_label = "[0:v:0]" if len(list_filters) == 1 else f"[vf{idx_filter}]"
+        list_decode.append(f"{input_label}{filter_video + ',' if filter_video else ''}split={len(dict_labels[idx_filter])}" \
+                           + "".join([f"[{x}]" for x in dict_labels[idx_filter]]))
+    cmd_list += ["-filter_complex", ";".join(list_decode + list_graph)] + cmd_outputs
+    return run_encode(cmd_list, ",".join([x[0] for x in list_dests]), "batch", time_end - time_begin)
+
+
+VideoOptions = {"-c:v": 1, "-vcodec": 1, "-codec:v": 1, "-b:v": 1, "-refs": 1, "-coder": 1, "-preset": 1, "-f": 1}
+
+
+def smart_options(list_options):
+    """Split profile options into (video encode, audio/other output) options for a smart render"""
+    list_video = []
+    list_other = []
+    idx = 0
+    while idx < len(list_options):
+        num_args = VideoOptions.get(list_options[idx], 0)
+        if num_args:
+            if list_options[idx] != "-f":   # pieces use their own container
+                list_video += list_options[idx:idx + 1 + num_args]
+            idx += 1 + num_args
+            continue
+        list_other.append(list_options[idx])
+        idx += 1
+    return list_video, list_other
+
+
+def smart_render_ok(input_video, profile_str):
+    """True if clips of this source can keep its own h264 frames between keyframes: the profile encodes
+    libx264 with at most a deinterlace and the source is progressive 8-bit 4:2:0 h264 at a known frame rate"""
+    filter_video, list_options = profile_split(profile_str)
+    if list_options is None or filter_video not in (None, "yadif") or "libx264" not in list_options:
+        return False
+    info = probe(input_video)
+    return info is not None and info.codec == "h264" and info.pix_fmt in ("yuv420p", "yuvj420p") \
+        and info.field_order in ("progressive", "unknown", "") and info.frame_rate > 0
+
+
+def video_cut_smart (source, start, stop, dest, profile, list_keyframes, has_audio=True, num_threads=0):
+    """Re-encode only the partial GOPs at the head and tail of a clip and stream-copy the keyframe-aligned
+    middle, joined with the concat demuxer; returns -1 if there is no whole GOP to copy"""
+    _, list_options = profile_split(profile)
+    info = probe(source)
+    idx_first = bisect.bisect_left(list_keyframes, start)
+    idx_last = bisect.bisect_right(list_keyframes, stop) - 1
+    if list_options is None or info is None or idx_first >= len(list_keyframes) or idx_last <= idx_first:
+        return -1
+    key_first = list_keyframes[idx_first]
+    key_last = list_keyframes[idx_last]
+    list_video, list_other = smart_options(list_options)
+    list_progress = []   # last report of each piece, for the clip's encode stats
+    time_start = time.monotonic()
+    if num_threads > 0:
+        list_video += ["-threads", str(num_threads)]
+
+    # frame counts per piece so that copied B-frames past the last keyframe can't sneak in
+    def frame_index(time_point):   # first frame at or after a time
+        return math.ceil(round(time_point * info.frame_rate, 6))
+    num_head = frame_index(key_first) - frame_index(start)
+    num_middle = frame_index(key_last) - frame_index(key_first)
+    num_tail = frame_index(stop) - frame_index(key_last)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(dest))) as dir_temp:
+        list_pieces = []
+        for time_begin, num_frames, is_copy in [(start, num_head, False), (key_first, num_middle, True), (key_last, num_tail, False)]:
+            if num_frames <= 0:
+                continue
+            path_piece = os.path.join(dir_temp, f"piece{len(list_pieces)}.mp4")
+            cmd_list = ["ffmpeg", "-v", "quiet", "-y", "-ss", str(time_begin), "-i", source, "-map", "0:v:0",
+                        "-frames:v", str(num_frames)]
+            if is_copy:
+                cmd_list += ["-c:v", "copy"]
+            else:   # the source is progressive, so the profile's deinterlace is skipped as in the copied middle
+                cmd_list += ["-vf", "setpts=PTS-STARTPTS"] + list_video
+            retcode = run_encode(cmd_list + ["-f", "mp4", path_piece], dest, "smart", 0, list_progress)
+            if retcode != 0 or not os.path.exists(path_piece):
+                return retcode or -1
+            list_pieces.append(path_piece)
+
+        path_list = os.path.join(dir_temp, "pieces.txt")
+        with open(path_list, 'wt') as f:
+            f.write("".join([f"file '{x}'\n" for x in list_pieces]))
+        cmd_list = ["ffmpeg", "-v", "quiet", "-y", "-f", "concat", "-safe", "0", "-i", path_list]
+        cmd_outputs = ["-map", "0:v:0", "-c:v", "copy"]
+        if has_audio:   # audio is short to encode, so it comes straight from the source
+            cmd_list += ["-ss", str(start), "-t", str(stop - start), "-i", source]
+            cmd_outputs += ["-map", "1:a:0"]
+        retcode = run_media(cmd_list + cmd_outputs + list_other + ["-f", "mp4", dest], stdout=False).returncode
+    frames = sum([int(x.get("frame", 0)) for x in list_progress])
+    metrics().encode_add(encode_record(dest, "smart", time.monotonic() - time_start, {"frame": frames}, stop - start))
+    return retcode if retcode != 0 or os.path.exists(dest) else -1
+
+
+def get_audio_streams (input_video):
+    """Count the audio streams in a video (batched cuts need to know before building a filter graph)"""
+    info = probe(input_video)
+    return info.audio_streams if info is not None else 0
+
+
+def encode_threads(num_workers, num_threads=0):
+    """Split available cores between parallel encode jobs and ffmpeg's own threads (0 lets ffmpeg decide)"""
+    if num_threads > 0:
+        return num_threads
+    if num_workers <= 1:
+        return 0
+    return max(1, (os.cpu_count() or 1) // num_workers)
+
+
+def cut_clips(job):
+    """Cut one batch of clips and thumbnails (one process per clip if needed); also used as a pool worker;
+    with a keyframe list each clip is smart rendered where possible; with a list of profiles each
+    scene's clipname is a list of renditions, encoded together from one decode; thumbnails are skipped
+    when the bulk thumbnail stage makes them from the source"""
+    input_video, list_scenes, profile_str, has_audio, num_threads, list_keyframes, with_thumbs = job
+    list_profiles = profile_str if type(profile_str) == list else [profile_str]
+    if (len(list_scenes) > 1 or len(list_profiles) > 1) and all([profile_split(x)[1] is not None for x in list_profiles]):
+        retcode = video_cut_batch (input_video, [x[:2] for x in list_scenes], [x[2] for x in list_scenes],
+                                   profile_str, has_audio, num_threads=num_threads, with_thumbs=with_thumbs)
+        if retcode == 0:
+            return [x[2] for x in list_scenes]
+        logger.warning (f"Batched cut of {len(list_scenes)} clips failed ({retcode}), falling back to one clip at a time")
+    for start, stop, clipname in list_scenes:
+        list_names = clipname if type(clipname) == list else [clipname]
+        for name, profile_rendition in zip(list_names, list_profiles):
+            retcode = -1
+            if list_keyframes is not None:
+                retcode = video_cut_smart (input_video, start, stop, name, profile_rendition, list_keyframes, has_audio, num_threads)
+            if retcode != 0:
+                video_cut (input_video, start, stop, name,
+                           f"{profile_rendition} -threads {num_threads}" if num_threads > 0 else profile_rendition)
+        if with_thumbs:
+            make_thumbnail (list_names[0])
+    return [x[2] for x in list_scenes]
+
+
+def cut_clips_worker(job):
+    """cut_clips in a pool process, returning its clips and the encode metrics recorded there"""
+    with metrics().capture() as dict_metrics:
+        list_done = cut_clips(job)
+    return list_done, dict_metrics
+
+
+def cut_clips_warm(job_timeout):
+    """cut_clips_worker in the long-lived pool, which was forked before this job's media timeout was set"""
+    job, timeout = job_timeout
+    os.environ[TIMEOUT_ENV] = timeout
+    return cut_clips_worker(job)
+
+
+_encode_pool = None   # (Pool, workers) kept between get_clips calls by a long-running process
+
+
+def encode_pool_start(num_workers):
+    """Keep one encode pool for every later get_clips in this process (e.g. the daemon) instead of one per call;
+    start it before any threads so the workers fork cleanly"""
+    global _encode_pool
+    encode_pool_stop()
+    if num_workers > 1:
+        _encode_pool = (Pool(num_workers), num_workers)
+    return _encode_pool
+
+
+def encode_pool_stop():
+    global _encode_pool
+    if _encode_pool is not None:
+        _encode_pool[0].close()
+        _encode_pool[0].join()
+        _encode_pool = None
 
 
 def thumb(name):
@@ -38,14 +340,32 @@ def thumb(name):
 
 
 def make_thumbnail (fname, posn=1):
-    success = True
-    try:
-        th_name = thumb(fname)
-        os.system (f"ffmpeg -v quiet -y -ss {posn} -i {fname} -vframes 1 -q:v 2 {th_name}")
-    except Exception as err:
-        logger.error (f"make_thumbnail {fname}: {err}")
-        success = False
-    return success
+    th_name = thumb(fname)
+    cmd_list = ["ffmpeg", "-v", "quiet", "-y", "-ss", str(posn), "-i", fname, "-vframes", "1", "-q:v", "2", th_name]
+    return run_media(cmd_list, stdout=False).returncode == 0
+
+
+def make_thumbnails (source, scene_list, dest_list, posn=1, size="", chunk_size=32, max_jobs=2, filter_video=None):
+    """Grab every scene's thumbnail straight from the source, seeking each input of one ffmpeg process
+    to its frame (chunked to bound open inputs, max_jobs chunks at a time); posn is the offset into each
+    scene (its start if the scene is shorter) and size a width or WxH to scale to (-2 keeps the aspect ratio);
+    filter_video is the clips' video filter (e.g. yadif or a letterbox crop), applied before the scale"""
+    list_filters = [filter_video] if filter_video else []
+    if size:
+        width, height = (str(size).lower().split("x") + ["-2"])[:2]
+        list_filters.append(f"scale={width}:{height}")
+    filter_size = ["-vf", ",".join(list_filters)] if len(list_filters) else []
+    list_cmds = []
+    for idx_chunk in range(0, len(scene_list), chunk_size):
+        cmd_inputs, cmd_outputs = [], []
+        for idx, (start, stop) in enumerate(scene_list[idx_chunk:idx_chunk + chunk_size]):
+            cmd_inputs += ["-ss", str(start + posn if start + posn < stop else start), "-i", source]
+            cmd_outputs += ["-map", f"{idx}:v:0", "-frames:v", "1", "-q:v", "2"] + filter_size \
+                           + [dest_list[idx_chunk + idx]]
+        list_cmds.append(["ffmpeg", "-v", "quiet", "-y"] + cmd_inputs + cmd_outputs)
+    list_failed = [x.returncode for x in run_media_many(list_cmds, max_jobs, stdout=False) if x.returncode != 0]
+    return list_failed[0] if len(list_failed) else 0
+
 
 def validate_profile(profile_name='list'):
     """Helper to validate a profile or to list them with the special name 'list'..."""
@@ -59,37 +379,42 @@ def validate_profile(profile_name='list'):
                 logger.info(f"    [{name}] - (no output files will be generated)")
         return False
 
-    if profile_name not in ClipProfiles:
-        logger.warning(f"Profile '{profile_name}' not in known list of encoding profiles, skipping output generation.")
-        return False
+    for name in profile_name.split(','):   # a comma list asks for several renditions of each clip
+        if name not in ClipProfiles:
+            logger.warning(f"Profile '{name}' not in known list of encoding profiles, skipping output generation.")
+            return False
     return True
 
 
-# from https://stackoverflow.com/questions/1131220/get-md5-hash-of-big-files-in-python
-def videofile_md5(filename, chunk_size=65536):
-    import hashlib
-    with open(filename, "rb") as f:
-        file_hash = hashlib.md5()
-        while True:
-            chunk = f.read(chunk_size)
-            if len(chunk) < 1:
-                break
-            file_hash.update(chunk)
-    return file_hash.hexdigest()
+def videofile_md5(filename, chunk_size=1 << 22):
+    """Full-file MD5 (uncached), see fingerprint.fingerprint for cached and sampled variants"""
+    return file_md5(filename, chunk_size)
 
 
-def get_clips (input_video, scene_list, output_dir, overwrite=False, profile="default"):
+@metric_timed("get_clips")
+def get_clips (input_video, scene_list, output_dir, overwrite=False, profile="default", batch_size=8, batch_gap=10,
+               num_workers=1, num_threads=0, hash_mode="full", letterbox_mode="sparse", cut_mode="encode",
+               return_renditions=False, thumbnail_mode="source", thumbnail_offset=1, thumbnail_size="", clip_done=None):
+    """Cut each scene into a clip and thumbnail under a directory named by the source fingerprint;
+    cut_mode 'smart' stream-copies whole GOPs of compatible h264 sources and re-encodes only the edges;
+    a comma list (or list) of profiles makes a rendition ladder from one decode of each clip, named
+    'video.S-E.PROFILE.ext' after the first profile; return_renditions gives a {profile: path} dict per scene;
+    thumbnail_mode 'source' grabs all thumbnails from the source in one ffmpeg alongside the encodes (through
+    the first profile's video filter, so e.g. letterbox thumbnails are cropped like their clips), 'clip'
+    from each finished clip; clip_done(index, clip) is called as each scene's clip is finished (or found)"""
     list_clips = []
-    if not validate_profile(profile):
+    list_names = profile.split(',') if type(profile) == str else list(profile)
+    if not validate_profile(",".join(list_names)):
         return list_clips
 
-    profile_str = ClipProfiles[profile]
-    if len(profile_str) == 0:   # empty or non-generating profile
+    list_names = [x for x in list_names if len(ClipProfiles[x])]
+    if len(list_names) == 0:   # empty or non-generating profile
         logger.info (f"Clip generation skipped with profile: {profile}")
         return list_clips
         
     try:
-        hashed_name = videofile_md5(input_video) 
+        with metrics().span("fingerprint"):
+            hashed_name = fingerprint(input_video, hash_mode)
     except Exception as err:
         logger.error (f"get_clips {input_video}: {err}")
         return list_clips
@@ -97,28 +422,111 @@ def get_clips (input_video, scene_list, output_dir, overwrite=False, profile="de
     if not os.path.exists(outdirname):
         os.makedirs(outdirname, exist_ok=True)
 
-    if profile == 'letterbox':
-        mod = find_crop_coordinates (input_video)  # returns ffmpeg syntax
-        profile_str = profile_str.format(mod)
+    list_profiles = []
+    for name in list_names:
+        profile_str = ClipProfiles[name]
+        if name == 'letterbox':
+            mod = crop_coordinates (input_video, hashed_name, letterbox_mode)  # returns ffmpeg syntax
+            profile_str = profile_str.format(mod)
+        list_profiles.append(profile_str)
+    profile_str = list_profiles[0] if len(list_profiles) == 1 else list_profiles
   
     ext = os.path.splitext(input_video)[1]
+    list_pending = []
+    dict_pending = {}   # first clip file -> its position in list_pending (repeated scenes share one clip)
+    list_pending_scenes = []   # scene indices of each pending clip, for clip_done
+    dict_thumbs = {}   # jpg -> (start, stop) for the bulk thumbnail stage
     for start,stop in scene_list:
-        clipname = os.path.join (outdirname, f"video.{start:.2f}-{stop:.2f}{ext}")
-        if overwrite or not os.path.exists (clipname):
-            video_cut (input_video, start, stop, clipname, profile_str)
-            make_thumbnail (clipname)
+        dict_renditions = {}
+        for idx, name in enumerate(list_names):
+            suffix = "" if idx == 0 else f".{name}"
+            dict_renditions[name] = os.path.join (outdirname, f"video.{start:.2f}-{stop:.2f}{suffix}{ext}")
+        clipname = list(dict_renditions.values())
+        if overwrite or not all([os.path.exists(x) for x in clipname]):
+            if clipname[0] not in dict_pending:
+                dict_pending[clipname[0]] = len(list_pending)
+                list_pending.append((start, stop, clipname if len(clipname) > 1 else clipname[0]))
+                list_pending_scenes.append([])
+            list_pending_scenes[dict_pending[clipname[0]]].append(len(list_clips))
+        else:
+            logger.info (f"Skipping already existing: {clipname[0]}")
+        if overwrite or not os.path.exists(thumb(clipname[0])):
+            dict_thumbs[thumb(clipname[0])] = (start, stop)
+        list_clips.append(dict_renditions if return_renditions else clipname[0])
+
+    def jobs_done(list_done):
+        if clip_done is not None:
+            for clipname in list_done:
+                for idx in list_pending_scenes[dict_pending[clipname[0] if type(clipname) == list else clipname]]:
+                    clip_done(idx, list_clips[idx])
+
+    if clip_done is not None:
+        set_pending = set([idx for list_idx in list_pending_scenes for idx in list_idx])
+        for idx, clip in enumerate(list_clips):
+            if idx not in set_pending:
+                clip_done(idx, clip)
+
+    list_keyframes = None
+    if cut_mode == "smart":
+        if len(list_profiles) > 1:
+            logger.info (f"Smart render is not used for a rendition ladder, encoding '{profile}' from one decode")
+        elif smart_render_ok(input_video, profile_str):
+            list_keyframes = keyframe_index(input_video)
+        if list_keyframes is None:
+            logger.info (f"Smart render not possible for '{input_video}' with profile '{profile}', re-encoding whole clips")
+
+    list_batches = [[idx] for idx in range(len(list_pending))]
+    can_batch = all([profile_split(x)[1] is not None for x in list_profiles])
+    if len(list_profiles) > 1 and not can_batch:
+        logger.info (f"Profiles '{profile}' can't share a decode, encoding each rendition separately")
+    if batch_size > 1 and len(list_pending) > 1 and list_keyframes is None:   # smart render works clip by clip
+        if not can_batch:
+            logger.info (f"Profile '{profile}' can't be batched, cutting one clip at a time")
         else:
-            logger.info (f"Skipping already existing: {clipname}")
-        list_clips.append(clipname)
+            list_batches = batch_scenes([x[:2] for x in list_pending], batch_size, batch_gap)
+    has_audio = True
+    if max([len(x) for x in list_batches] + [0]) > 1 or list_keyframes is not None or len(list_profiles) > 1:
+        has_audio = get_audio_streams(input_video) > 0
+
+    # longest jobs start first so a late long clip doesn't hold up the tail; list_clips keeps scene order
+    list_batches.sort(key=lambda batch: sum([list_pending[idx][1] - list_pending[idx][0] for idx in batch]), reverse=True)
+    num_workers = max(1, min(num_workers, len(list_batches)))
+    num_threads = encode_threads(num_workers, num_threads)
+    with_thumbs = thumbnail_mode == "clip"
+    list_jobs = [(input_video, [list_pending[idx] for idx in batch], profile_str, has_audio, num_threads, list_keyframes, with_thumbs)
+                 for batch in list_batches]
+    # a pool for this call forks before the thumbnail thread starts, so no worker inherits a lock held by that thread
+    with (Pool(num_workers) if num_workers > 1 and _encode_pool is None else nullcontext()) as pool, \
+            ThreadPoolExecutor(1) as executor:   # thumbnails come from the source while the clips encode
+        future_thumbs = None
+        if not with_thumbs and len(dict_thumbs):
+            future_thumbs = executor.submit(make_thumbnails, input_video, list(dict_thumbs.values()),
+                                            list(dict_thumbs.keys()), thumbnail_offset, thumbnail_size,
+                                            filter_video=profile_split(list_profiles[0])[0])
+        if num_workers > 1 and _encode_pool is not None:   # warm pool, at most its own size in parallel
+            logger.info (f"Encoding {len(list_jobs)} jobs with the running pool of {_encode_pool[1]} workers ({num_threads} threads each)")
+            timeout = os.environ.get(TIMEOUT_ENV, "0")
+            for list_done, dict_metrics in _encode_pool[0].imap_unordered(cut_clips_warm, [(x, timeout) for x in list_jobs]):
+                metrics().merge(dict_metrics)
+                logger.info (f"Finished encoding: {list_done}")
+                jobs_done(list_done)
+        elif pool is not None:
+            logger.info (f"Encoding {len(list_jobs)} jobs with {num_workers} workers ({num_threads} threads each)")
+            for list_done, dict_metrics in pool.imap_unordered(cut_clips_worker, list_jobs):
+                metrics().merge(dict_metrics)
+                logger.info (f"Finished encoding: {list_done}")
+                jobs_done(list_done)
+        else:
+            for job in list_jobs:
+                jobs_done(cut_clips(job))
+        if future_thumbs is not None and future_thumbs.result() != 0:
+            logger.warning (f"Some thumbnails for '{input_video}' could not be extracted")
     return list_clips
 
 
 def get_duration (input_video):
-    import subprocess
-    if not os.path.exists(input_video):
-        return 0
-    res = subprocess.check_output(f'ffprobe -i {input_video} -show_entries format=duration -v quiet -of csv="p=0"',shell=True)
-    return float(res)
+    info = probe(str(input_video))
+    return info.duration if info is not None else 0
 
 
 
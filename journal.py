@@ -0,0 +1,108 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import threading
+import logging
+
+logger = logging.getLogger()
+
+JOURNAL_VERSION = 1   # bump when the record layout changes so older journals are started over
+
+
+def scene_key(time_begin, time_end):
+    """Scene identity in a journal, the same rounding as the clip file names"""
+    return f"{float(time_begin):.2f}-{float(time_end):.2f}"
+
+
+def json_value(value):
+    """numpy scalars (and anything else json can't write) as plain values"""
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class ResultJournal():
+    """JSON Lines journal of finished scene records, each flushed and fsynced as it is written, so that a
+    crashed run keeps its finished clips; the first line names the run (input and profile) and a journal
+    from a different run, or any run with overwrite, is started over"""
+
+    def __init__(self, path_journal, dict_run, overwrite=False):
+        self.path_journal = str(path_journal)
+        self.lock = threading.Lock()
+        self.records = {}   # scene key -> record, the last written wins
+        dict_header = dict({"journal": JOURNAL_VERSION}, **dict_run)
+        if not overwrite and os.path.exists(self.path_journal):
+            self.records = self.load(dict_header)
+        if not len(self.records):
+            with open(self.path_journal, 'wt') as f:
+                f.write(json.dumps(dict_header, default=json_value) + "\n")
+        else:
+            logger.info(f"Resuming from {len(self.records)} finished scenes in '{self.path_journal}'")
+        self.f = open(self.path_journal, 'at')
+        if self.f.tell() > 0:
+            with open(self.path_journal, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":   # end a torn last line so the next record starts on its own
+                    self.f.write("\n")
+
+    def load(self, dict_header):
+        """Records of an earlier run with the same header; a torn last line (a crash mid-write) is dropped"""
+        dict_records = {}
+        with open(self.path_journal, 'rt') as f:
+            list_lines = f.read().split("\n")
+        try:
+            if json.loads(list_lines[0]) != json.loads(json.dumps(dict_header, default=json_value)):
+                logger.info(f"Journal '{self.path_journal}' is from a different run, starting over")
+                return {}
+        except ValueError:
+            return {}
+        for line in list_lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            dict_records[scene_key(record["time_begin"], record["time_end"])] = record
+        return dict_records
+
+    def finished(self, time_begin, time_end):
+        """Record of a scene from this or an earlier run whose files all still exist, else None; a thumbnail
+        made from the source may still have been pending (or have failed) when the clip was journaled"""
+        record = self.records.get(scene_key(time_begin, time_end))
+        if record is None:
+            return None
+        list_paths = list(record.get("renditions", {}).values()) or [record.get("path", "")]
+        if len(record.get("thumbnail", "")) and not os.path.exists(record["thumbnail"]):
+            return None
+        return record if all([len(x) and os.path.exists(x) for x in list_paths]) else None
+
+    def append(self, record):
+        line = json.dumps(record, default=json_value) + "\n"
+        with self.lock:
+            self.f.write(line)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.records[scene_key(record["time_begin"], record["time_end"])] = json.loads(line)
+
+    def results(self, list_scenes):
+        """Records of the given (begin, end) scenes in order, as read back from the journal"""
+        return [self.records[scene_key(*x)] for x in list_scenes if scene_key(*x) in self.records]
+
+    def close(self):
+        self.f.close()
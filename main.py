@@ -18,11 +18,10 @@
 # ===============LICENSE_END=========================================================
 # -*- coding: utf-8 -
 
-from os import getenv
+from os import getenv, environ
 import sys
 from pathlib import Path
 import argparse
-import pandas as pd
 from datetime import datetime
 import json
 
@@ -35,40 +34,68 @@ logger.setLevel(logging.INFO)
 import contentaiextractor as contentai
 import _version
 
-from getclips import get_clips, get_duration, validate_profile
-from event_retrieval import parse_results, event_rle, load_scenes, event_alignment
-
-import bisect
+from metrics import metrics, prometheus_write
+# pandas, numpy and the metadata parsers are imported by the stages that use them, so '--help',
+# '--profile list' and clip-bounds-only runs start without them
 
 def do_alignment (metadata_path, align_type, time_tuples, list_of_extractors=None):
+    from event_retrieval import parse_results
+    from event_index import EventIndex
     print("metadata_path: " + str(metadata_path))
     print("align_type: " + str(align_type))
     print("time_tuples: " + str(time_tuples))
     print("list_of_extractors: " + str(list_of_extractors))
     bounds = parse_results(metadata_path, verbose=True, parser_type=align_type)
     print("type of bounds is" + str(type(bounds)))
+    index = EventIndex(bounds)
     if list_of_extractors is not None and len(list_of_extractors) > 0:
-        bounds = bounds[bounds['extractor'].isin(list_of_extractors)]
-    starts = sorted(bounds['time_begin'])       # start and stop must be sorted separately b/c of possible overlap
-    stops = sorted(bounds['time_end'])
+        index = index.subset(extractor=list_of_extractors)
+    starts = index.sorted_values('time_begin')       # start and stop must be sorted separately b/c of possible overlap
+    stops = index.sorted_values('time_end')
     output = []
     for t_begin, t_end in time_tuples:
-        left = bisect.bisect_left(starts, t_begin) - 1
+        left = index.before(t_begin, 'time_begin', 'left')
         new_begin = starts[left] if left >= 0 else starts[0]
-        right = bisect.bisect_right(stops, t_end)
+        right = index.after(t_end, 'time_end', 'right')
         new_end = stops[right] if right < len(stops) else stops[-1]
-        output.append((new_begin, new_end))
+        output.append((float(new_begin), float(new_end)))
     return output
 
 
-def clip(input_params=None, args=None):
-    # extract data from contentai.content_url
-    # or if needed locally use contentai.content_path
-    # after calling contentai.download_content()
+def write_results(dict_result, path_result, csv_file=""):
+    """Write data.json and optionally a CSV of the scene records (without event details) in the result directory"""
+    if not path_result.exists():
+        path_result.mkdir(parents=True)
+    path_output = path_result.joinpath("data.json")
+    with path_output.open('wt') as f:
+        json.dump(dict_result, f)
+    logger.info(f"Written JSON to '{path_output.resolve()}'...")
+
+    if len(csv_file):
+        import pandas as pd
+        path_output = path_result.joinpath(csv_file)
+        if not path_output.parent.exists():
+            path_output.parent.mkdir(parents=True)
+        df_scenes = pd.DataFrame(dict_result['results'])
+        if "event_begin" in df_scenes.columns:
+            df_scenes = df_scenes.drop(columns=['event_begin', 'event_end'])
+        df_scenes.to_csv(str(path_output), index=False)
+        logger.info(f"Written CSV records to '{path_output.resolve()}'...")
+
+
+def scene_mean(list_scenes):
+    """Average length of the scene records"""
+    return sum([row["time_end"] - row["time_begin"] for row in list_scenes]) / max(1, len(list_scenes))
 
-    print("Downloading content from ContentAI")
-    contentai.download_content()
 
+_parser = None   # built once per process (batch workers run many clips)
+
+
+def clip_parser():
+    """Argument parser for clip(), also used by batch.py to convert manifest rows to arguments"""
+    global _parser
+    if _parser is not None:
+        return _parser
     parser = argparse.ArgumentParser(
         description="""A script to launch a clip extraction and transcode process...""",
         epilog="""
@@ -116,11 +143,30 @@ def clip(input_params=None, args=None):
                             help='FILE to specify scene begin,end or DIRECTORY with extractor event outputs')
     submain.add_argument('--quiet', dest='quiet', default=False, action='store_true', help='do not verbosely print operations')
     submain.add_argument('--csv_file', dest='csv_file', default='', type=str, help='also write output records to this CSV file (in the result dir)')
+    submain.add_argument('--journal_file', type=str, default='', help='append each scene record to this JSON Lines file (in the result dir) as its clip finishes; a rerun skips scenes already there')
     submain.add_argument('--snack_id', type=int, default=-10, help='append unique identifier to the row')
+    submain.add_argument('--metadata_no_cache', default=False, action='store_true', help='always re-parse extractor outputs instead of using the metadata cache')
+    submain.add_argument('--metadata_workers', type=int, default=1, help='extractor outputs parsed concurrently (default %(default)s)')
+    submain.add_argument('--metadata_pool', type=str, default='thread', choices=['thread', 'process'], help='pool type for concurrent parsing (default %(default)s)')
+    submain.add_argument('--run_no_cache', default=False, action='store_true', help='always run every stage instead of reusing an identical earlier run (or its scenes for other encoding options); runs that never read a missing (not yet downloaded) path_content are not reused')
+    submain.add_argument('--metadata_compact', default=False, action='store_true', help='keep compact event tables (categorical tags, float32 times, fewer columns) for very long assets')
 
     submain = parser.add_argument_group('encoding/output specifications')
-    submain.add_argument('--profile', type=str, default='none', help='processing profile to use (specify "list" for available list)')
-    submain.add_argument('--overwrite', default=False, action='store_true', help='force overwrite of existing files')
+    submain.add_argument('--profile', type=str, default='none', help='processing profile to use (specify "list" for available list, or a comma list for a rendition ladder)')
+    submain.add_argument('--overwrite', default=False, action='store_true', help='force overwrite of existing files (an identical earlier run\'s result is not reused, its scenes still are)')
+    submain.add_argument('--clip_batch_size', type=int, default=8, help='max clips cut from one ffmpeg process (1=one process per clip, default %(default)s)')
+    submain.add_argument('--clip_batch_gap', type=float, default=10, help='max seconds between clips cut from one ffmpeg process (default %(default)s)')
+    submain.add_argument('--encode_workers', type=int, default=1, help='max ffmpeg encode jobs to run in parallel (default %(default)s)')
+    submain.add_argument('--encode_threads', type=int, default=0, help='ffmpeg threads per encode job (0=split cores across workers, default %(default)s)')
+    submain.add_argument('--cut_mode', type=str, default='encode', choices=['encode', 'smart'], help='re-encode whole clips ("encode") or only the partial GOPs at their edges for compatible h264 sources ("smart") (default %(default)s)')
+    submain.add_argument('--keyframe_snap', default=False, action='store_true', help='move scene begins to the next keyframe inside the scene (frame-accurate "default" stream copy)')
+    submain.add_argument('--thumbnail_mode', type=str, default='source', choices=['source', 'clip'], help='grab all thumbnails from the source in one ffmpeg alongside the encodes, through the profile\'s video filter ("source") or from each finished clip ("clip") (default %(default)s)')
+    submain.add_argument('--thumbnail_offset', type=float, default=1, help='seconds into each scene for its thumbnail with thumbnail_mode "source" (default %(default)s)')
+    submain.add_argument('--thumbnail_size', type=str, default='', help='thumbnail width or WxH with thumbnail_mode "source" (empty=source size, default %(default)s)')
+    submain.add_argument('--letterbox_mode', type=str, default='sparse', choices=['sparse', 'frames', 'head'], help='letterbox detection from keyframes across the video with cropdetect ("sparse") or numpy ("frames"), or the first two minutes ("head") (default %(default)s)')
+    submain.add_argument('--metrics_file', type=str, default='', help='also write run timings in Prometheus text format here (e.g. for the node-exporter textfile collector)')
+    submain.add_argument('--media_timeout', type=float, default=0, help='seconds before any one ffmpeg/ffprobe job is killed (0=no limit, default %(default)s)')
+    submain.add_argument('--hash_mode', type=str, default='full', choices=['full', 'sampled'], help='fingerprint naming the output directory; "full" matches earlier runs, "sampled" is fast (default %(default)s)')
 
     submain = parser.add_argument_group('overall boundary modifications')
     # submain.add_argument('--time_smudge', type=float, default=0.5, help='time in seconds to rewind/ffwd final scene boundaries (0=off, default %(default)s)')
@@ -139,12 +185,19 @@ def clip(input_params=None, args=None):
     submain.add_argument('--alignment_extractors', nargs='+', default=None, help='use shots only from these extractors during alignment')
     submain.add_argument('--alignment_min_score', type=float, default=0.6, help='min confidence for new event to be use in trim (default %(default)s)')
     submain.add_argument('--alignment_no_shrink', default=False, action='store_true', help='forbid shrinking alignment during processing')
-    
-    input_vars = contentai.metadata
-    if args is not None:
-        input_vars.update(vars(parser.parse_args(args)))
-    else:
-        input_vars.update(vars(parser.parse_args()))
+    _parser = parser
+    return parser
+
+
+def clip(input_params=None, args=None, download=True):
+    # extract data from contentai.content_url
+    # or if needed locally use contentai.content_path
+    # after calling contentai.download_content() (when the content is first read, if not already local)
+
+    dict_args = vars(clip_parser().parse_args(args))   # None reads sys.argv; '--help' exits here, before other work
+    metadata = contentai.metadata() if callable(contentai.metadata) else contentai.metadata   # a function in newer releases
+    input_vars = dict(metadata or {})   # a copy, so one clip's settings don't leak into the next
+    input_vars.update(dict_args)
     if input_params is not None:
         input_vars.update(input_params)
 
@@ -152,6 +205,10 @@ def clip(input_params=None, args=None):
 
     if input_vars['quiet']:
         logger.setLevel(logging.WARNING)
+    metrics().reset()
+    if input_vars['media_timeout'] > 0:   # read by every media job, including those in encode workers
+        from media_runner import TIMEOUT_ENV
+        environ[TIMEOUT_ENV] = str(input_vars['media_timeout'])
 
     logger.info(f"Received parameters: {input_vars}")
     logger.info(f"Running Version: {version_info}")
@@ -164,81 +221,195 @@ def clip(input_params=None, args=None):
         if path_scenes.is_dir() and path_scenes.exists():
             meta = path_scenes
         else:
+            content_path()   # extractor outputs sit beside the content
             meta = path_video.parent
         return str(meta)
 
+    parse_options = {"use_cache": not input_vars['metadata_no_cache'], "num_workers": input_vars['metadata_workers'],
+                     "pool_type": input_vars['metadata_pool'], "compact": input_vars['metadata_compact']}
+
+    def content_path ():    # content is downloaded when first read, never if path_content is already local
+        nonlocal download
+        if download and not path_video.exists():
+            print("Downloading content from ContentAI")
+            contentai.download_content()
+        download = False
+        return str(path_video)
+
+    from getclips import validate_profile
     if not validate_profile(input_vars['profile']):
         return None
 
     logger.info("*p1* (asset extraction) ffmpeg operation to pull out clips; provide specific processing profiles")
+    metrics().stage("p1")
+
+    scene_key, result_key, list_cached = None, None, None
+    use_metadata = (input_vars['clip_bounds'] is None and not path_scenes.is_file()) \
+        or input_vars['alignment_type'] is not None or len(input_vars['finalize_type']) > 0
+    from getclips import ClipProfiles
+    reads_content = any([len(ClipProfiles[x]) for x in input_vars['profile'].split(",") if x in ClipProfiles]) \
+        or (input_vars['clip_bounds'] is not None and input_vars['clip_bounds'][1] < 0) or input_vars['keyframe_snap'] \
+        or (use_metadata and not path_scenes.is_dir())
+    if not input_vars['run_no_cache'] and reads_content:
+        content_path()   # runs are keyed by the content itself, so download it now if the run reads it anyway
+    if not input_vars['run_no_cache'] and path_video.exists():   # runs that never read missing content aren't memoized
+        from run_cache import run_keys, run_load, run_store, result_files_exist
+        with metrics().span("run_cache"):
+            scene_key, result_key = run_keys(path_video, input_vars, meta_path() if use_metadata else None, version_info['version'])
+            dict_cached = run_load("result", result_key) if not input_vars['overwrite'] else None   # overwrite re-cuts the clips
+        if dict_cached is not None and result_files_exist(dict_cached):
+            logger.info(f"Same source, metadata and options as an earlier run ({result_key}), reusing its result")
+            if len(input_vars['path_result']) > 0 and not path_result.joinpath("data.json").exists():
+                write_results(dict_cached, path_result, input_vars['csv_file'])
+            metrics().stage()
+            return dict_cached
+        list_cached = run_load("scenes", scene_key)
 
-    duration_video = get_duration(path_video)  # attempt to get duration, 0 if not available
     logger.info("*p2* (clip specification) peak detection and alignment to various input components (e.g. shots, etc)")
-    if input_vars['clip_bounds'] is not None:       # this overrides any other scene designations
+    metrics().stage("p2")
+    # scenes are records (dicts with time_begin and time_end); only the event and alignment stages use pandas
+    if list_cached is not None:   # same source, metadata and scene options as an earlier run
+        list_scenes = list_cached
+        logger.info(f"Reusing {len(list_scenes)} scenes of an earlier run ({scene_key})")
+    elif input_vars['clip_bounds'] is not None:       # this overrides any other scene designations
         if input_vars['clip_bounds'][1] < 0.0:
-            input_vars['clip_bounds'][1] += duration_video
+            from getclips import get_duration
+            input_vars['clip_bounds'][1] += get_duration(content_path())   # attempt to get duration, 0 if not available
         if input_vars['duration_max'] > 0.0:   # if max duration passed, hard-limit response
             input_vars['clip_bounds'][1] = min(input_vars['clip_bounds'][0] + input_vars['duration_max'],  input_vars['clip_bounds'][1])
-        df_scenes = pd.DataFrame([input_vars['clip_bounds']], columns=["time_begin", "time_end"])
+        list_scenes = [{"time_begin": input_vars['clip_bounds'][0], "time_end": input_vars['clip_bounds'][1]}]
     else:
+        from event_retrieval import load_scenes, parse_results, event_rle
         df_scenes = load_scenes(str(path_scenes))
         if df_scenes is None:
-            df_event = parse_results(meta_path(), input_vars['event_type'], verbose=not input_vars['quiet'])
+            df_event = parse_results(meta_path(), input_vars['event_type'], verbose=not input_vars['quiet'], **parse_options)
             df_scenes = event_rle(df_event, score_threshold=input_vars['event_min_score'], 
                                     duration_threshold=input_vars['duration_min'], 
                                     duration_expand=input_vars['event_expand_length'], peak_method='rle')
-    if df_scenes is None or not len(df_scenes):
+        list_scenes = df_scenes.to_dict(orient='records') if df_scenes is not None else []
+    if not len(list_scenes):
         logger.error(f"Error: No scene sources were provided ('{input_vars['path_scenes']}') or found with events, aborting.")
         return
 
-    logger.info(f"Found {len(df_scenes)} scenes with average length {(df_scenes['time_end']-df_scenes['time_begin']).mean()}s from source file...")
+    logger.info(f"Found {len(list_scenes)} scenes with average length {scene_mean(list_scenes)}s from source file...")
     logger.info("*p3a* (quality assessment) quality evaluation of frames or video for refined boundaries")
     logger.info("*p3b* (moderation assessment) quality evaluation of frames or video for refined boundaries")
     logger.info("*p3* (trimming refinement) refinement based on quality requirements (if any)")
+    metrics().stage("p3")
 
     if input_vars['alignment_type'] is None:  # if no alignment type specified, use faullback
         if len(input_vars['finalize_type']):
             logger.warning(f"Upgrading 'finalize' event type '{input_vars['finalize_type']}' to primary alignment type (which was empty).")
             input_vars['alignment_type'] = input_vars['finalize_type']
 
-    if input_vars['alignment_type'] != None:  # if we had an alignment type
+    if input_vars['alignment_type'] != None and list_cached is None:  # if we had an alignment type
+        from event_retrieval import parse_results, event_alignment
+        from event_index import EventIndex
         df_event = parse_results(meta_path(), input_vars['alignment_type'], 
                                  verbose=not input_vars['quiet'], 
-                                 extractor_list=input_vars['alignment_extractors'])
+                                 extractor_list=input_vars['alignment_extractors'], **parse_options,
+                                 score_threshold=input_vars['alignment_min_score'] if input_vars['metadata_compact'] else None)
         if df_event is None or len(df_event) == 0:
             logger.warning(f"Warning: Requested specific alignment type '{input_vars['alignment_type']}' but no events found, trimming may have no effect.")
+        df_event = EventIndex(df_event)   # sorted once, shared by the begin and end searches
         df_events_fallback = None
         if len(input_vars['finalize_type']) and input_vars['finalize_type'] != input_vars['alignment_type']:   # had additional fallback type
-            df_events_fallback = parse_results(meta_path(), input_vars['finalize_type'], verbose=not input_vars['quiet'])
+            df_events_fallback = parse_results(meta_path(), input_vars['finalize_type'], verbose=not input_vars['quiet'], **parse_options,
+                                               score_threshold=input_vars['alignment_min_score'] if input_vars['metadata_compact'] else None)
             logger.info(f"(alignment boundaries include {len(df_events_fallback)} fallback events of type '{input_vars['finalize_type']}')")
+            df_events_fallback = EventIndex(df_events_fallback)
 
-        for idx, row in df_scenes.iterrows():
+        for idx, row in enumerate(list_scenes):
             logger.info(f"[PRE-Scene {idx}]: START {row['time_begin']} - END {row['time_end']} ")
 
-        df_scenes = event_alignment(df_event, df_scenes, input_vars['duration_max'], input_vars['duration_min'], 
+        import pandas as pd
+        df_scenes = event_alignment(df_event, pd.DataFrame(list_scenes), input_vars['duration_max'], input_vars['duration_min'], 
                                     df_events_fallback=df_events_fallback, score_threshold=input_vars['alignment_min_score'],
                                     allow_flip=not input_vars['alignment_no_shrink'])
-        for idx, row in df_scenes.iterrows():
+        list_scenes = df_scenes.to_dict(orient='records')
+        for idx, row in enumerate(list_scenes):
             logger.info(f"[POST-Scene {idx}]: START {row['time_begin']} ({row['event_begin']}) - END {row['time_end']} ({row['event_end']})")
 
+    if input_vars['keyframe_snap'] and len(list_scenes) and list_cached is None:   # stream copy then starts exactly at each scene begin
+        from mediainfo import keyframe_index
+        from event_retrieval import keyframe_snap
+        list_keyframes = keyframe_index(content_path())
+        if list_keyframes is None:
+            logger.warning(f"Warning: Could not index keyframes of '{path_video}', scene boundaries are not snapped.")
+        else:
+            import pandas as pd
+            list_scenes = keyframe_snap(pd.DataFrame(list_scenes), list_keyframes, input_vars['duration_min']).to_dict(orient='records')
+            logger.info(f"Snapped scene begins to the next of {len(list_keyframes)} keyframes (keeping scenes of at least {input_vars['duration_min']}s)")
+
+    if scene_key is not None and list_cached is None and len(list_scenes):
+        run_store("scenes", scene_key, list_scenes)
+
     list_clips = []
-    if len(df_scenes):
+    journal = None
+    dict_columns = {"alignment_type": input_vars['alignment_type'], "event_type": input_vars['event_type']}
+    if input_vars['snack_id'] >= 0:
+        dict_columns["snack_id"] = input_vars['snack_id']
+    if len(list_scenes):
         # if input_vars['time_smudge'] > 0.0:
         #     t_smudge = input_vars['time_smudge']
         #     df_scenes["time_begin"] = df_scenes["time_begin"].apply(lambda x: 0 if x - t_smudge < 0 else x - t_smudge)            
         #     df_scenes["time_end"] = df_scenes["time_end"].apply(lambda x: 0 if x + t_smudge > duration_video else x + t_smudge)
 
-        logger.info(f"Trimmed to {len(df_scenes)} scenes with average length {(df_scenes['time_end']-df_scenes['time_begin']).mean()}s from source file...")
+        logger.info(f"Trimmed to {len(list_scenes)} scenes with average length {scene_mean(list_scenes)}s from source file...")
         logger.info("*p4* (previous input) processing input for regions")
-        time_tuples = df_scenes[["time_begin", "time_end"]].values.tolist()
-        list_clips = get_clips(str(path_video), time_tuples, path_result, 
-                                profile=input_vars['profile'], overwrite=input_vars['overwrite'])
-        df_scenes["path"] = ""
-    if len(list_clips):
-        logger.info(f"Clipped video files stored as: '{list_clips}'... ")
-        df_scenes["path"] = list_clips
+        metrics().stage("p4")
+        time_tuples = [[row["time_begin"], row["time_end"]] for row in list_scenes]
+        from getclips import get_clips, ClipProfiles, thumb
+        list_todo = list(range(len(time_tuples)))   # scenes to cut, all but those finished in the journal
+        if len(input_vars['journal_file']):
+            from journal import ResultJournal
+            path_result.mkdir(parents=True, exist_ok=True)
+            journal = ResultJournal(path_result.joinpath(input_vars['journal_file']),
+                                    {"input": str(path_video.resolve()), "profile": input_vars['profile']}, input_vars['overwrite'])
+            list_todo = [idx for idx in list_todo if journal.finished(*time_tuples[idx]) is None]
+            logger.info(f"Journal '{journal.path_journal}' has {len(time_tuples) - len(list_todo)} of {len(time_tuples)} scenes finished")
+        list_rows = [dict(row) for row in list_scenes]
+        set_journaled = set()
+
+        def clip_done (idx, clip):     # scene record as in data.json (and its thumbnail), written as each clip finishes
+            idx = list_todo[idx]
+            record = dict(list_rows[idx], path=list(clip.values())[0] if len(clip) else "")
+            if len(clip) > 1:
+                record["renditions"] = clip
+            record.update(dict_columns)
+            record["thumbnail"] = thumb(record["path"]) if len(record["path"]) else ""
+            journal.append(record)
+            set_journaled.add(idx)
+
+        if len(list_todo) and any([len(ClipProfiles[x]) for x in input_vars['profile'].split(",") if x in ClipProfiles]):
+            content_path()   # clips are encoded, read the content
+        list_clips = get_clips(str(path_video), [time_tuples[x] for x in list_todo], path_result,
+                                profile=input_vars['profile'], overwrite=input_vars['overwrite'],
+                                batch_size=input_vars['clip_batch_size'], batch_gap=input_vars['clip_batch_gap'],
+                                num_workers=input_vars['encode_workers'], num_threads=input_vars['encode_threads'],
+                                hash_mode=input_vars['hash_mode'], letterbox_mode=input_vars['letterbox_mode'],
+                                cut_mode=input_vars['cut_mode'], return_renditions=True,
+                                thumbnail_mode=input_vars['thumbnail_mode'], thumbnail_offset=input_vars['thumbnail_offset'],
+                                thumbnail_size=input_vars['thumbnail_size'],
+                                clip_done=clip_done if journal is not None else None)
+        for row in list_scenes:
+            row["path"] = ""
+    if journal is not None:   # data.json and the CSV are rebuilt from the journal
+        for idx in range(len(list_todo)):
+            if list_todo[idx] not in set_journaled:   # no clip made (e.g. no profile), still a finished scene
+                clip_done(idx, list_clips[idx] if len(list_clips) else {})
+        list_scenes = [{k: v for k, v in record.items() if k != "thumbnail"} for record in journal.results(time_tuples)]
+        journal.close()
+        logger.info(f"Rebuilt {len(list_scenes)} scene records from the journal '{journal.path_journal}'")
+    elif len(list_clips):
+        for row, clip in zip(list_scenes, list_clips):
+            row["path"] = list(clip.values())[0]
+            if len(list_clips[0]) > 1:   # rendition ladder, every encoded path per scene
+                row["renditions"] = clip
+        logger.info(f"Clipped video files stored as: '{[row['path'] for row in list_scenes]}'... ")
 
     logger.info("*p5* (clip publishing) push of clips to result directory, an S3 bucket, hadoop, azure, etc")
+    metrics().stage("p5")
 
     # write output of each class and segment
     version_dict = _version.version()
@@ -246,30 +417,23 @@ def clip(input_params=None, args=None):
                             'input':str(path_video.resolve()), 'timestamp': str(datetime.now()) }, 'results':[] }
     # enrich each row with event type info
     logger.info(f"Trimmed to {len(list_clips)} scenes...")
-    df_scenes["alignment_type"] = input_vars['alignment_type']
-    df_scenes["event_type"] = input_vars['event_type']    
-    if input_vars['snack_id'] >= 0:
-        df_scenes["snack_id"] = input_vars['snack_id']
-    dict_result['results'] = df_scenes.to_dict(orient='records')
+    for row in list_scenes:
+        row.update(dict_columns)
+    dict_result['results'] = list_scenes
 
     # write out data if completed
     logger.info("*p6* exporting cut times to csv/json files file")
+    metrics().stage("p6")
+    dict_result['metrics'] = metrics().summary()   # stage timings and per-clip encode stats so far
     if len(input_vars['path_result']) > 0:
-        if not path_result.exists():
-            path_result.mkdir(parents=True)
-        path_output = path_result.joinpath("data.json")
-        with path_output.open('wt') as f:
-            json.dump(dict_result, f)
-        logger.info(f"Written JSON to '{path_output.resolve()}'...")
-
-        if len(input_vars['csv_file']):
-            path_output = path_result.joinpath(input_vars['csv_file'])
-            if not path_output.parent.exists():
-                path_output.parent.mkdir(parents=True)
-            if "event_begin" in df_scenes.columns:
-                df_scenes = df_scenes.drop(columns=['event_begin', 'event_end'])
-            df_scenes.to_csv(str(path_output), index=False)
-            logger.info(f"Written CSV records to '{path_output.resolve()}'...")
+        write_results(dict_result, path_result, input_vars['csv_file'])
+
+    if len(input_vars['metrics_file']):
+        prometheus_write(input_vars['metrics_file'], metrics().summary(), {"asset": path_video.name})
+        logger.info(f"Written metrics to '{input_vars['metrics_file']}'...")
+
+    if result_key is not None and result_files_exist(dict_result):   # later identical runs return this result
+        run_store("result", result_key, dict_result)
 
     # done writing results, just return
     return dict_result
@@ -0,0 +1,214 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import signal
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+MediaResult = namedtuple("MediaResult", ["returncode", "stdout", "stderr", "seconds", "timed_out", "num_read"], defaults=(0,))
+
+READ_CHUNK = 1 << 16   # bytes asked of the stdout pipe per read when streaming into a buffer
+DRAIN_SECONDS = 1   # longest wait for a killed process's pipes to reach their end
+
+TIMEOUT_ENV = "CLIP_EXTRACTOR_TIMEOUT"   # default per-job timeout in seconds (unset or 0 for none)
+
+
+def media_timeout():
+    """Default per-job timeout from the environment (also seen by encode pool workers), None for no limit"""
+    try:
+        seconds = float(os.environ.get(TIMEOUT_ENV, "0"))
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+def parse_progress(lines):
+    """Blocks of ffmpeg '-progress' key=value lines as dicts (out_time in seconds), one per 'progress=' line"""
+    list_blocks = []
+    block = {}
+    for line in lines:
+        key, _, value = line.strip().partition("=")
+        if not key or not _:
+            continue
+        block[key] = value.strip()
+        if key == "progress":
+            if block.get("out_time_us", "N/A") not in ("", "N/A"):   # out_time_ms is also in microseconds
+                block["out_time"] = int(block["out_time_us"]) / 1e6
+            list_blocks.append(block)
+            block = {}
+    return list_blocks
+
+
+def kill_process(proc):
+    """Kill an asyncio subprocess by pid; Process.kill polls (reaps) a child that just exited, leaving
+    asyncio's child watcher without its exit status"""
+    if proc.returncode is None:
+        try:
+            os.kill(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+async def close_process(proc):
+    """Kill a process if it is still running, reap it, read its pipes to the end, and close its transport
+    while the loop is still running (else the transport's __del__ fails once asyncio.run closes the loop);
+    a pipe held open by an orphaned grandchild (which also holds up wait() on newer Pythons) is given up
+    on after DRAIN_SECONDS"""
+    kill_process(proc)
+    try:
+        await asyncio.wait_for(proc.wait(), DRAIN_SECONDS)
+        for stream in (proc.stdout, proc.stderr):
+            if stream is not None:
+                await asyncio.wait_for(stream.read(), DRAIN_SECONDS)
+    except (asyncio.TimeoutError, OSError, ValueError):
+        pass
+    transport = getattr(proc, "_transport", None)   # asyncio's Process has no public close
+    if transport is not None:
+        transport.close()
+    await asyncio.sleep(0)   # the pipes' connection_lost callbacks run before the caller returns
+
+
+class MediaRunner():
+    """Runs ffmpeg/ffprobe argument lists as asyncio subprocesses with per-job timeouts, cancellation
+    (the process is killed), and a limit on concurrent jobs; run_many awaits a list of jobs together"""
+
+    def __init__(self, max_jobs=None, timeout=None):
+        self.max_jobs = max_jobs
+        self.timeout = timeout if timeout is not None else media_timeout()
+        self._limits = {}   # event loop -> semaphore, created inside the loop that uses it
+
+    def _limit(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._limits:
+            self._limits[loop] = asyncio.Semaphore(self.max_jobs) if self.max_jobs else None
+        return self._limits[loop]
+
+    async def run(self, cmd_list, timeout=None, progress=None, stdout=True, stderr=False, into=None):
+        """Run one command; with a progress callable, ffmpeg writes '-progress pipe:1' (so stdout can't be the
+        output) and each block is passed to it as parsed; with a writable buffer 'into', stdout is copied into
+        it as it arrives (num_read bytes, any more is read and dropped) instead of being collected;
+        returncode is -1 on a timeout or launch failure"""
+        limit = self._limit()
+        if limit is not None:
+            async with limit:
+                return await self._run(cmd_list, timeout, progress, stdout, stderr, into)
+        return await self._run(cmd_list, timeout, progress, stdout, stderr, into)
+
+    async def _run(self, cmd_list, timeout, progress, stdout, stderr, into=None):
+        cmd_list = [str(x) for x in cmd_list]
+        if progress is not None:
+            cmd_list = cmd_list[:1] + ["-progress", "pipe:1", "-nostats"] + cmd_list[1:]
+        timeout = timeout if timeout is not None else self.timeout
+        time_start = time.time()
+        task_start = asyncio.ensure_future(asyncio.create_subprocess_exec(*cmd_list, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if stdout or progress is not None or into is not None else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE if stderr else asyncio.subprocess.DEVNULL))
+        try:
+            proc = await asyncio.shield(task_start)
+        except asyncio.CancelledError:   # cancelled while starting: the process may still appear, so kill it then
+            try:
+                proc = await task_start
+            except OSError:
+                raise asyncio.CancelledError()
+            await close_process(proc)
+            raise
+        except OSError as err:
+            logger.error(f"MediaRunner {cmd_list[0]}: {err}")
+            return MediaResult(-1, b"", b"", 0.0, False)
+
+        async def read_progress():
+            list_lines = []
+            async for line in proc.stdout:
+                list_lines.append(line.decode(errors="ignore"))
+                if line.startswith(b"progress="):
+                    for block in parse_progress(list_lines):
+                        progress(block)
+                    list_lines = []
+            await proc.wait()
+            return b"", b""
+
+        view = memoryview(into).cast("B") if into is not None else None
+        num_read = 0
+
+        async def read_into():
+            nonlocal num_read
+            async def read_err():
+                return await proc.stderr.read() if stderr else b""
+            task_err = asyncio.ensure_future(read_err())
+            try:
+                while True:
+                    chunk = await proc.stdout.read(READ_CHUNK)
+                    if not len(chunk):
+                        break
+                    num_copy = min(len(chunk), len(view) - num_read)
+                    view[num_read:num_read + num_copy] = chunk[:num_copy]
+                    num_read += num_copy
+                await proc.wait()
+                return b"", await task_err
+            finally:
+                task_err.cancel()
+
+        try:
+            if progress is not None:
+                task = read_progress()
+            else:
+                task = read_into() if view is not None else proc.communicate()
+            data_out, data_err = await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            await close_process(proc)
+            logger.warning(f"MediaRunner {cmd_list[0]}: killed after {timeout}s timeout ({cmd_list[-1]})")
+            return MediaResult(-1, b"", b"", time.time() - time_start, True, num_read)
+        except asyncio.CancelledError:
+            await close_process(proc)
+            raise
+        await close_process(proc)   # already exited, this only lets its transport close
+        if proc.returncode != 0:
+            logger.warning(f"MediaRunner {cmd_list[0]}: exit {proc.returncode} ({cmd_list[-1]})")
+        return MediaResult(proc.returncode, data_out or b"", data_err or b"", time.time() - time_start, False, num_read)
+
+    async def run_many(self, list_cmds, **kwargs):
+        """Results of several commands in order, run concurrently up to max_jobs"""
+        return await asyncio.gather(*[self.run(cmd_list, **kwargs) for cmd_list in list_cmds])
+
+
+def run_sync(coroutine):
+    """Result of a coroutine from synchronous code (a worker thread if this thread's loop is already running)"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def run_media(cmd_list, max_jobs=None, **kwargs):
+    """MediaResult of one command, see MediaRunner.run"""
+    return run_sync(MediaRunner(max_jobs).run(cmd_list, **kwargs))
+
+
+def run_media_many(list_cmds, max_jobs=None, **kwargs):
+    """MediaResults of several commands run together, at most max_jobs at a time"""
+    return run_sync(MediaRunner(max_jobs).run_many(list_cmds, **kwargs))
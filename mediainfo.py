@@ -0,0 +1,163 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+from collections import namedtuple
+import logging
+
+from fingerprint import fingerprint, stat_key, cache_dir, cache_read, cache_write
+from media_runner import run_media
+
+logger = logging.getLogger()
+
+MediaInfo = namedtuple("MediaInfo", ["duration", "width", "height", "frame_rate", "codec",
+                                     "keyframe_interval", "audio_streams", "pix_fmt", "field_order"])
+
+MEDIAINFO_VERSION = 2   # bump when fields change so stale disk entries are ignored
+KEYFRAME_SCAN = 30      # seconds of packets read to estimate the keyframe interval
+KEYFRAME_VERSION = 1    # bump when the keyframe index changes
+
+_mediainfo_memory = {}   # stat key -> MediaInfo, for this process
+_keyframe_memory = {}    # stat key -> keyframe times, for this process
+
+
+def parse_rate(rate_str):
+    """Convert an ffprobe rational like '30000/1001' to a float (0 if unknown)"""
+    num, _, den = str(rate_str).partition("/")
+    try:
+        return float(num) / float(den) if len(den) else float(num)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def parse_probe(rec):
+    """Build MediaInfo from ffprobe JSON with format, streams, and (video) packets"""
+    list_video = [x for x in rec.get("streams", []) if x.get("codec_type") == "video"]
+    stream_video = list_video[0] if len(list_video) else {}
+    duration = float(rec.get("format", {}).get("duration", stream_video.get("duration", 0)) or 0)
+    frame_rate = parse_rate(stream_video.get("avg_frame_rate", 0)) or parse_rate(stream_video.get("r_frame_rate", 0))
+
+    keyframe_interval = 0.0
+    list_keys = [float(x["pts_time"]) for x in rec.get("packets", [])
+                 if x.get("stream_index") == stream_video.get("index") and "K" in x.get("flags", "") and "pts_time" in x]
+    if len(list_keys) > 1:
+        list_keys.sort()
+        list_diff = sorted([list_keys[idx + 1] - list_keys[idx] for idx in range(len(list_keys) - 1)])
+        keyframe_interval = list_diff[len(list_diff) // 2]   # median, robust to scene-cut keyframes
+
+    return MediaInfo(duration=duration, width=int(stream_video.get("width", 0)), height=int(stream_video.get("height", 0)),
+                     frame_rate=frame_rate, codec=stream_video.get("codec_name", ""), keyframe_interval=keyframe_interval,
+                     audio_streams=len([x for x in rec.get("streams", []) if x.get("codec_type") == "audio"]),
+                     pix_fmt=stream_video.get("pix_fmt", ""), field_order=stream_video.get("field_order", "unknown"))
+
+
+def probe(filename, use_cache=True):
+    """One ffprobe per file for duration, dimensions, rate, codec, and keyframe interval; None if unavailable"""
+    if not os.path.exists(filename):
+        return None
+    key = stat_key(filename)
+    if use_cache and key in _mediainfo_memory:
+        return _mediainfo_memory[key]
+
+    key_disk = None
+    if use_cache:
+        key_disk = f"v{MEDIAINFO_VERSION}:{fingerprint(filename, 'sampled')}"
+        dict_cache = cache_read("mediainfo.json")
+        if key_disk in dict_cache:
+            info = MediaInfo(**dict_cache[key_disk])
+            _mediainfo_memory[key] = info
+            return info
+
+    cmd_list = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams",
+                "-show_entries", "packet=stream_index,pts_time,flags", "-read_intervals", f"%+{KEYFRAME_SCAN}", filename]
+    result = run_media(cmd_list)
+    try:
+        if result.returncode != 0:
+            raise ValueError(f"ffprobe exit {result.returncode}")
+        rec = json.loads(result.stdout)
+    except ValueError as err:
+        logger.error(f"probe {filename}: {err}")
+        return None
+    info = parse_probe(rec)
+
+    _mediainfo_memory[key] = info
+    if key_disk is not None:
+        dict_cache = cache_read("mediainfo.json")
+        dict_cache[key_disk] = info._asdict()
+        cache_write("mediainfo.json", dict_cache)
+    return info
+
+
+def parse_keyframes(lines):
+    """Keyframe times from ffprobe csv packet (pts_time, flags) and format (start_time) lines, relative to the
+    start time as used by -ss"""
+    time_start = 0.0
+    list_keys = []
+    for line in lines:
+        line_parts = line.strip().split(",")
+        if line_parts[0] == "format" and len(line_parts) > 1:
+            time_start = float(line_parts[1]) if line_parts[1] not in ("", "N/A") else 0.0
+        elif line_parts[0] == "packet" and len(line_parts) > 2 and "K" in line_parts[2] and line_parts[1] not in ("", "N/A"):
+            list_keys.append(float(line_parts[1]))
+    return sorted(set([round(x - time_start, 6) for x in list_keys]))
+
+
+def keyframe_index(filename, use_cache=True):
+    """Sorted keyframe times of the first video stream from one ffprobe packet scan (no decoding); cached on
+    disk per source under the cache directory; None if unavailable"""
+    if not os.path.exists(filename):
+        return None
+    key = stat_key(filename)
+    if use_cache and key in _keyframe_memory:
+        return _keyframe_memory[key]
+
+    path_cache = None
+    if use_cache and cache_dir() is not None:
+        path_cache = os.path.join(cache_dir(), "keyframes")
+        os.makedirs(path_cache, exist_ok=True)
+        name_cache = os.path.join("keyframes", f"v{KEYFRAME_VERSION}.{fingerprint(filename, 'sampled')}.json")
+        dict_cache = cache_read(name_cache)
+        if "keyframes" in dict_cache:
+            _keyframe_memory[key] = dict_cache["keyframes"]
+            return dict_cache["keyframes"]
+
+    cmd_list = ["ffprobe", "-v", "quiet", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags:format=start_time",
+                "-of", "csv", filename]
+    result = run_media(cmd_list)
+    try:
+        if result.returncode != 0:
+            raise ValueError(f"ffprobe exit {result.returncode}")
+        list_keys = parse_keyframes(result.stdout.decode(errors="ignore").split("\n"))
+    except ValueError as err:
+        logger.error(f"keyframe_index {filename}: {err}")
+        return None
+
+    _keyframe_memory[key] = list_keys
+    if path_cache is not None:
+        cache_write(name_cache, {"keyframes": list_keys})
+    return list_keys
+
+
+if __name__ == '__main__':
+    for line in sys.stdin:
+        info = probe(line.strip())
+        print(f"{line.strip()}\t{json.dumps(info._asdict() if info is not None else None)}")
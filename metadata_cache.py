@@ -0,0 +1,182 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+
+from fingerprint import cache_dir
+
+logger = logging.getLogger()
+
+CACHE_SUBDIR = ".clip_extractor_cache"
+CACHE_VERSION = 1   # bump when the stored table layout changes
+
+MEMORY_TABLES = 16      # parsed tables kept in memory (least recently used dropped), bounded for long-lived processes
+
+_metadata_memory = OrderedDict()   # (state key, parser name) -> flattened DataFrame, for this process
+_parser_extractors = {}   # parser name -> the extractor directory it reads
+
+
+def memory_get(key):
+    df = _metadata_memory.get(key)
+    if df is not None:
+        _metadata_memory.move_to_end(key)
+    return df
+
+
+def memory_put(key, df):
+    _metadata_memory[key] = df
+    _metadata_memory.move_to_end(key)
+    while len(_metadata_memory) > MEMORY_TABLES:
+        _metadata_memory.popitem(last=False)
+
+
+def parser_extractors(list_modules):
+    """Directory name each parser reads (its EXTRACTOR, e.g. 'dsai_moderation' reads 'dsai_moderation_image'),
+    None where it can't be found; the names are fixed per parser class, so they are looked up once per process"""
+    dict_extractors = {}
+    for parser_obj in list_modules:
+        if parser_obj['name'] not in _parser_extractors:
+            level, list_handlers = logger.level, list(logger.handlers)   # some parsers set up the root logger
+            try:
+                extractor = getattr(parser_obj['obj']("", logger=logger), "EXTRACTOR", None)
+            except Exception as err:
+                logger.warning(f"parser_extractors {parser_obj['name']}: {err}")
+                extractor = None
+            finally:
+                logger.setLevel(level)
+                logger.handlers[:] = list_handlers
+            _parser_extractors[parser_obj['name']] = extractor if type(extractor) == str and len(extractor) else None
+        dict_extractors[parser_obj['name']] = _parser_extractors[parser_obj['name']]
+    return dict_extractors
+
+
+def metadata_states(dir_content, list_modules):
+    """Key per parser over the files it reads, those under directories named after its extractor anywhere
+    below dir_content (as the parsers search), by relative path, size, and mtime; anything else there
+    (e.g. results, clips, or the video itself) doesn't change the keys and isn't stat'ed, except for a
+    parser whose extractor is unknown, which is keyed on every file outside the known extractors' directories"""
+    path_root = os.path.abspath(dir_content)
+    dict_extractors = parser_extractors(list_modules)
+    set_known = set([x for x in dict_extractors.values() if x is not None])
+    dict_state = {x: [] for x in set_known}
+    list_unknown = []   # files of no known extractor, only stat'ed if some parser's extractor is unknown
+    for dir_walk, list_dirs, list_files in os.walk(path_root):
+        list_dirs[:] = sorted([x for x in list_dirs if x != CACHE_SUBDIR])
+        list_owners = set([x for x in os.path.relpath(dir_walk, path_root).split(os.sep) if x in set_known])
+        if not len(list_owners) and None not in dict_extractors.values():
+            continue
+        for name in sorted(list_files):
+            path_file = os.path.join(dir_walk, name)
+            try:
+                st = os.stat(path_file)
+            except OSError:
+                continue
+            entry = f"{os.path.relpath(path_file, path_root)}:{st.st_size}:{st.st_mtime_ns}"
+            for owner in list_owners:
+                dict_state[owner].append(entry)
+            if not len(list_owners):
+                list_unknown.append(entry)
+    dict_keys = {}
+    for name, extractor in dict_extractors.items():
+        state_hash = hashlib.md5(f"v{CACHE_VERSION}|{path_root}|{name}|{extractor}|".encode())
+        state_hash.update("|".join(dict_state[extractor] if extractor is not None else list_unknown).encode())
+        dict_keys[name] = state_hash.hexdigest()
+    return dict_keys
+
+
+def metadata_state(dir_content, list_modules=None):
+    """One key over the inputs of the given parsers (default all discovered ones), see metadata_states"""
+    if list_modules is None:
+        from contentai_metadata_flatten.parsers import get_by_type
+        list_modules = get_by_type()
+    dict_keys = metadata_states(dir_content, list_modules)
+    return hashlib.md5("|".join([dict_keys[x] for x in sorted(dict_keys)]).encode()).hexdigest()
+
+
+def metadata_cache_dir(dir_content):
+    """Cache next to the metadata if writable, otherwise under the shared cache directory"""
+    path_local = os.path.join(os.path.abspath(dir_content), CACHE_SUBDIR)
+    try:
+        os.makedirs(path_local, exist_ok=True)
+        if os.access(path_local, os.W_OK):
+            return path_local
+    except OSError:
+        pass
+    path_shared = cache_dir()
+    if path_shared is None:
+        return None
+    path_shared = os.path.join(path_shared, "metadata", hashlib.md5(os.path.abspath(dir_content).encode()).hexdigest())
+    os.makedirs(path_shared, exist_ok=True)
+    return path_shared
+
+
+def metadata_load(dir_content, state_key, parser_name):
+    """Flattened table for one parser from memory or disk (Feather if pyarrow is installed, else pickle); None on miss"""
+    key = (state_key, parser_name)
+    df = memory_get(key)
+    if df is not None:
+        return df
+    path_cache = metadata_cache_dir(dir_content)
+    if path_cache is None:
+        return None
+    path_base = os.path.join(path_cache, f"{parser_name}.{state_key}")
+    df = None
+    try:
+        if os.path.exists(path_base + ".feather"):
+            df = pd.read_feather(path_base + ".feather")
+        elif os.path.exists(path_base + ".pkl"):
+            df = pd.read_pickle(path_base + ".pkl")
+    except Exception as err:
+        logger.warning(f"metadata_load {path_base}: {err}")
+        return None
+    if df is not None:
+        memory_put(key, df)
+    return df
+
+
+def metadata_store(dir_content, state_key, parser_name, df):
+    """Save the flattened table for one parser, replacing tables from older directory states"""
+    df = df.reset_index(drop=True)
+    memory_put((state_key, parser_name), df)
+    path_cache = metadata_cache_dir(dir_content)
+    if path_cache is None:
+        return df
+    for name in os.listdir(path_cache):   # drop stale states for this parser
+        if name.startswith(f"{parser_name}.") and not name.startswith(f"{parser_name}.{state_key}."):
+            try:
+                os.remove(os.path.join(path_cache, name))
+            except OSError:
+                pass
+    path_base = os.path.join(path_cache, f"{parser_name}.{state_key}")
+    try:
+        df.to_feather(path_base + ".feather")
+    except Exception:   # no pyarrow or columns it can't encode (e.g. mixed objects)
+        if os.path.exists(path_base + ".feather"):
+            os.remove(path_base + ".feather")
+        try:
+            df.to_pickle(path_base + ".pkl")
+        except Exception as err:
+            logger.warning(f"metadata_store {path_base}: {err}")
+    return df
@@ -0,0 +1,177 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+PROM_PREFIX = "clip_extractor"
+
+
+class Metrics():
+    """Monotonic timings for one run: sequential stages, timed calls, and per-clip encode stats"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.time_start = time.monotonic()
+            self.stages = {}       # stage -> seconds, in stage order
+            self.stage_now = None  # (stage, start)
+            self.spans = []        # {"name", "seconds"} per timed call
+            self.encodes = []      # {"clip", "mode", "seconds", "frames", "fps", "speed"} per encoded clip
+
+    def stage(self, name=None):
+        """End the current stage and start the next (None just ends it)"""
+        time_now = time.monotonic()
+        with self.lock:
+            if self.stage_now is not None:
+                stage_last, time_last = self.stage_now
+                self.stages[stage_last] = self.stages.get(stage_last, 0) + time_now - time_last
+            self.stage_now = None if name is None else (name, time_now)
+
+    def span_add(self, name, seconds):
+        with self.lock:
+            self.spans.append({"name": name, "seconds": seconds})
+
+    def encode_add(self, record):
+        with self.lock:
+            self.encodes.append(record)
+
+    @contextmanager
+    def span(self, name):
+        time_start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.span_add(name, time.monotonic() - time_start)
+
+    @contextmanager
+    def capture(self):
+        """Collect the spans and encodes recorded inside the block (e.g. in a pool worker) to hand back to the parent"""
+        with self.lock:
+            spans, encodes = self.spans, self.encodes
+            self.spans, self.encodes = [], []
+        dict_captured = {"spans": [], "encodes": []}
+        try:
+            yield dict_captured
+        finally:
+            with self.lock:
+                dict_captured["spans"], dict_captured["encodes"] = self.spans, self.encodes
+                self.spans, self.encodes = spans, encodes
+
+    def merge(self, dict_captured):
+        with self.lock:
+            self.spans += dict_captured["spans"]
+            self.encodes += dict_captured["encodes"]
+
+    def summary(self):
+        """Block for data.json: stage seconds (the current one so far), call counts and seconds by name, and the encodes"""
+        time_now = time.monotonic()
+        with self.lock:
+            dict_stages = dict(self.stages)
+            if self.stage_now is not None:
+                dict_stages[self.stage_now[0]] = dict_stages.get(self.stage_now[0], 0) + time_now - self.stage_now[1]
+            dict_calls = {}
+            for span in self.spans:
+                call = dict_calls.setdefault(span["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+                call["count"] += 1
+                call["seconds"] += span["seconds"]
+                call["max_seconds"] = max(call["max_seconds"], span["seconds"])
+            return {"total_seconds": time_now - self.time_start, "stages": dict_stages,
+                    "calls": dict_calls, "encodes": list(self.encodes)}
+
+
+_metrics = Metrics()   # this process's run
+
+
+def metrics():
+    return _metrics
+
+
+def metric_timed(name):
+    """Decorator that records a span for every call"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _metrics.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def encode_record(clip, mode, seconds, progress=None, duration=0):
+    """Encode stats of one clip from ffmpeg's last '-progress' block (fps and speed as ffmpeg reports them,
+    falling back to frames and duration over wall time)"""
+    progress = progress or {}
+    def number(value):
+        try:
+            return float(str(value).rstrip("x"))
+        except ValueError:
+            return 0.0
+    frames = int(number(progress.get("frame", 0)))
+    fps = number(progress.get("fps", 0)) or (frames / seconds if seconds > 0 else 0.0)
+    speed = number(progress.get("speed", 0)) or (duration / seconds if seconds > 0 else 0.0)
+    return {"clip": clip, "mode": mode, "seconds": seconds, "frames": frames, "fps": fps, "speed": speed}
+
+
+def prometheus_text(summary, labels=None):
+    """Prometheus text exposition of a summary (for the node-exporter textfile collector)"""
+    def label_str(dict_labels):
+        dict_labels = dict(labels or {}, **dict_labels)
+        if not dict_labels:
+            return ""
+        return "{" + ",".join([k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+                               for k, v in dict_labels.items()]) + "}"
+    list_lines = [f"# HELP {PROM_PREFIX}_run_seconds Wall time of the whole run",
+                  f"# TYPE {PROM_PREFIX}_run_seconds gauge",
+                  f"{PROM_PREFIX}_run_seconds{label_str({})} {summary['total_seconds']:.6f}",
+                  f"# HELP {PROM_PREFIX}_stage_seconds Wall time of each processing stage",
+                  f"# TYPE {PROM_PREFIX}_stage_seconds gauge"]
+    list_lines += [f"{PROM_PREFIX}_stage_seconds{label_str({'stage': k})} {v:.6f}" for k, v in summary["stages"].items()]
+    list_lines += [f"# HELP {PROM_PREFIX}_call_seconds Total wall time of each timed call",
+                   f"# TYPE {PROM_PREFIX}_call_seconds gauge"]
+    list_lines += [f"{PROM_PREFIX}_call_seconds{label_str({'call': k})} {v['seconds']:.6f}" for k, v in summary["calls"].items()]
+    list_lines += [f"# HELP {PROM_PREFIX}_call_count Number of calls of each timed call",
+                   f"# TYPE {PROM_PREFIX}_call_count gauge"]
+    list_lines += [f"{PROM_PREFIX}_call_count{label_str({'call': k})} {v['count']}" for k, v in summary["calls"].items()]
+    dict_modes = {}
+    for record in summary["encodes"]:
+        mode = dict_modes.setdefault(record["mode"], {"clips": 0, "seconds": 0.0, "frames": 0})
+        mode["clips"] += 1
+        mode["seconds"] += record["seconds"]
+        mode["frames"] += record["frames"]
+    for metric, key, help_str in [("encode_clips", "clips", "Clips encoded"), ("encode_seconds", "seconds", "Wall time of clip encodes"),
+                                  ("encode_frames", "frames", "Video frames encoded")]:
+        list_lines += [f"# HELP {PROM_PREFIX}_{metric} {help_str} by cut mode", f"# TYPE {PROM_PREFIX}_{metric} gauge"]
+        list_lines += [f"{PROM_PREFIX}_{metric}{label_str({'mode': k})} {v[key]}" for k, v in dict_modes.items()]
+    return "\n".join(list_lines) + "\n"
+
+
+def prometheus_write(path_output, summary, labels=None):
+    """Write the text file atomically so a scrape never sees a partial file"""
+    path_temp = f"{path_output}.{os.getpid()}.tmp"
+    with open(path_temp, 'wt') as f:
+        f.write(prometheus_text(summary, labels))
+    os.replace(path_temp, path_output)
@@ -3,13 +3,16 @@ import sys
 import os
 import argparse
 
+from detect_letter_box import CropRecord, crop_info
+from media_runner import run_media
+
 def ffmpeg_crop(crop_info):
     src_video = crop_info[0]
     ffmpeg_crop_str = crop_info[1]
     output_dir = crop_info[2]
     dst_file  = os.path.join(output_dir, os.path.basename(src_video))
-    cmd="ffmpeg -i {} -vf {} {}".format(src_video, ffmpeg_crop_str, dst_file )
-    retcode = os.system(cmd)
+    cmd_list = ["ffmpeg", "-i", src_video, "-vf", ffmpeg_crop_str, dst_file]
+    retcode = run_media(cmd_list, stdout=False).returncode
     if retcode != 0:
         return "{}\tFailure".format(src_video)
     else:
@@ -17,10 +20,13 @@ def ffmpeg_crop(crop_info):
 
 
 def load_video_cropped_list(list_crop):
-    """load cropping from a list or list-like iterator (e.g. an open file)"""
+    """load cropping from a list or list-like iterator (e.g. an open file) or from CropRecord tuples"""
     video_cropped_info=[]
     is_header = True
     for line in list_crop:
+        if isinstance(line, CropRecord):
+            video_cropped_info.append((line.video_name, crop_info(line)))
+            continue
         #skip the header
         if is_header:
             is_header = False
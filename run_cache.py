@@ -0,0 +1,100 @@
+#! python
+# ===============LICENSE_START=======================================================
+# clip_extractor Apache-2.0
+# ===================================================================================
+# Copyright (C) 2017-2020 AT&T Intellectual Property. All rights reserved.
+# ===================================================================================
+# This software file is distributed by AT&T
+# under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============LICENSE_END=========================================================
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import hashlib
+import tempfile
+import logging
+
+from fingerprint import cache_dir, fingerprint
+
+logger = logging.getLogger()
+
+RUN_VERSION = 1   # bump when the stored scenes or results change
+RUN_SUBDIR = "runs"
+
+# clip() options that change the scenes, and those that only change how they are cut and written;
+# anything else (workers, threads, pools, batching, timeouts, logging) doesn't change the result
+SCENE_OPTIONS = ["path_scenes", "clip_bounds", "event_type", "event_expand_length", "event_min_score", "duration_max",
+                 "duration_min", "finalize_type", "alignment_type", "alignment_extractors", "alignment_min_score",
+                 "alignment_no_shrink", "keyframe_snap", "metadata_compact"]
+OUTPUT_OPTIONS = ["path_result", "profile", "cut_mode", "hash_mode", "letterbox_mode", "thumbnail_mode", "thumbnail_offset",
+                  "thumbnail_size", "snack_id", "csv_file", "journal_file"]
+
+
+def run_key(dict_parts):
+    return hashlib.md5(json.dumps(dict_parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def run_keys(path_video, input_vars, dir_meta=None, version=""):
+    """Keys of the scenes and of the whole result of a run: the source fingerprint, the state of the metadata
+    directory (if the scenes come from extractor outputs) or of a scene file, and the options that matter"""
+    dict_source = {"version": f"{version}/{RUN_VERSION}", "video": fingerprint(str(path_video), input_vars['hash_mode'])}
+    if dir_meta is not None:
+        from metadata_cache import metadata_state   # pandas and the parsers, only for runs that read metadata
+        dict_source["metadata"] = metadata_state(dir_meta)
+    path_scenes = input_vars['path_scenes']
+    if len(path_scenes) and os.path.isfile(path_scenes):
+        st = os.stat(path_scenes)
+        dict_source["scenes"] = f"{os.path.abspath(path_scenes)}:{st.st_size}:{st.st_mtime_ns}"
+    dict_scenes = dict(dict_source, **{x: input_vars[x] for x in SCENE_OPTIONS})
+    scene_key = run_key(dict_scenes)
+    return scene_key, run_key(dict(dict_scenes, **{x: input_vars[x] for x in OUTPUT_OPTIONS}))
+
+
+def run_load(kind, key):
+    """Stored scenes or result of an earlier run, None on a miss"""
+    path_cache = cache_dir()
+    if path_cache is None:
+        return None
+    try:
+        with open(os.path.join(path_cache, RUN_SUBDIR, f"{kind}.{key}.json"), 'rt') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_store(kind, key, value):
+    """Atomically store the scenes or result of a run (last writer wins)"""
+    path_cache = cache_dir()
+    if path_cache is None:
+        return False
+    try:
+        path_runs = os.path.join(path_cache, RUN_SUBDIR)
+        os.makedirs(path_runs, exist_ok=True)
+        fd, path_temp = tempfile.mkstemp(dir=path_runs, prefix=kind, suffix=".tmp")
+        with os.fdopen(fd, 'wt') as f:
+            json.dump(value, f, default=lambda x: x.item() if hasattr(x, "item") else str(x))
+        os.replace(path_temp, os.path.join(path_runs, f"{kind}.{key}.json"))
+    except OSError as err:
+        logger.warning(f"run_store {kind}: {err}")
+        return False
+    return True
+
+
+def result_files_exist(dict_result):
+    """Every clip (and rendition) named in a stored result is still on disk"""
+    for record in dict_result.get('results', []):
+        list_paths = list(record.get("renditions", {}).values()) if type(record.get("renditions")) == dict else []
+        list_paths += [record["path"]] if len(record.get("path", "")) else []
+        if not all([os.path.exists(x) for x in list_paths]):
+            return False
+    return True
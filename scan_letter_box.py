@@ -0,0 +1,91 @@
+from multiprocessing import Pool
+import sys
+import os
+import argparse
+import logging
+
+from detect_letter_box import detect_letter_box, crop_line
+from filter import filter_crop_dims
+from adjust_crop import adjust_crop
+
+logger = logging.getLogger()
+
+STR_HEADER = "video_name|crop_info|video_width|video_height|cropped_frame_width|cropped_frame_height\n"
+
+
+def scan_source(scan_info):
+    """detect, filter, and adjust one source in-process; returns (source, record or None, error or None)"""
+    video_file, sample_mode, threshold, adjust = scan_info
+    try:
+        list_crop = detect_letter_box([video_file], sample_mode=sample_mode, return_records=True)
+        list_crop = filter_crop_dims(list_crop, threshold)
+        if adjust:
+            list_crop = adjust_crop(list_crop)
+    except Exception as err:
+        return video_file, None, str(err)
+    return video_file, list_crop[0] if len(list_crop) else None, None
+
+
+def load_scanned(path_result):
+    """sources already in a results file or its '.done' companion (which also lists sources needing no crop)"""
+    set_done = set()
+    for path_read in [path_result, path_result + ".done"]:
+        if not os.path.exists(path_read):
+            continue
+        with open(path_read, 'rt') as f:
+            for line in f:
+                video_file = line.strip().split('|')[0]
+                if len(video_file) and video_file != "video_name":   # skip the header
+                    set_done.add(video_file)
+    return set_done
+
+
+def scan_letter_box(list_sources, path_result, num_workers=4, threshold=20, adjust=True, sample_mode="sparse"):
+    """scan sources on a worker pool and append each crop to path_result as soon as it completes;
+    sources already scanned by an earlier (possibly interrupted) run are skipped"""
+    set_done = load_scanned(path_result)
+    list_todo = []
+    for line in list_sources:
+        video_file = line.strip()
+        if len(video_file) and video_file not in set_done:
+            list_todo.append(video_file)
+            set_done.add(video_file)   # also drops repeats in the source list
+    logger.info(f"Scanning {len(list_todo)} sources ({len(set_done) - len(list_todo)} already scanned) with {num_workers} workers")
+
+    num_crop = 0
+    is_new = not os.path.exists(path_result) or os.path.getsize(path_result) == 0
+    with open(path_result, 'at') as o_f, open(path_result + ".done", 'at') as o_done:
+        if is_new:
+            o_f.write(STR_HEADER)
+            o_f.flush()
+        with Pool(max(1, num_workers)) as p:
+            list_scan = [(x, sample_mode, threshold, adjust) for x in list_todo]
+            for video_file, record, error in p.imap_unordered(scan_source, list_scan):
+                if error is not None:   # not marked done, so a later run retries it
+                    logger.error(f"scan_letter_box {video_file}: {error}")
+                    continue
+                if record is not None:
+                    o_f.write(crop_line(record))
+                    o_f.flush()
+                    num_crop += 1
+                o_done.write(f"{video_file}\n")
+                o_done.flush()
+    return num_crop
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="detect, filter, and adjust letterbox crops for many sources in one pass")
+    parser.add_argument('-i', action="store", help="file with one video per line (default stdin)", default=None)
+    parser.add_argument('-o', action="store", help="video cropped file (appended to, resumes an earlier run)", required=True)
+    parser.add_argument('-n', help="number of parallel processes", type=int, default=4)
+    parser.add_argument('-t', help="min border in pixels for a crop to be kept", type=float, default=20)
+    parser.add_argument('-m', help="letterbox sample mode (sparse, frames, head)", default="sparse")
+    parser.add_argument('--no_adjust', default=False, action='store_true', help="skip adjusting crops back to the source aspect")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.i is None:
+        scan_letter_box(sys.stdin, args.o, args.n, args.t, not args.no_adjust, args.m)
+    else:
+        with open(args.i, 'rt') as f:
+            scan_letter_box(f, args.o, args.n, args.t, not args.no_adjust, args.m)
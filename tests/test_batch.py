@@ -0,0 +1,26 @@
+import os
+
+import main
+from batch import batch_job, batch_jobs
+from media_runner import TIMEOUT_ENV
+
+
+def test_media_timeout_does_not_leak_to_later_rows(tmp_path, monkeypatch):
+    path_video = tmp_path / "video.mp4"
+    path_video.write_bytes(b"video")
+    list_seen = []
+
+    def clip(args, download):
+        list_seen.append(os.environ.get(TIMEOUT_ENV))
+        if "--media_timeout" in args:
+            os.environ[TIMEOUT_ENV] = args[args.index("--media_timeout") + 1]
+        return {"results": []}
+    monkeypatch.setattr(main, "clip", clip)
+    monkeypatch.delenv(TIMEOUT_ENV, raising=False)
+
+    list_jobs = batch_jobs([{"path_content": str(path_video), "media_timeout": "30"},
+                            {"path_content": str(path_video)}], str(tmp_path / "results"))
+    for job in list_jobs:
+        job["args"] = []
+        assert batch_job(job)["status"] == "ok"
+    assert list_seen == [None, None] and TIMEOUT_ENV not in os.environ
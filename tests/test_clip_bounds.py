@@ -0,0 +1,24 @@
+import os
+import sys
+import json
+import subprocess
+
+DIR_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_clip_bounds_run_skips_pandas(tmp_path):
+    (tmp_path / "video.mp4").write_bytes(os.urandom(1 << 12))   # never decoded with the 'none' profile
+    script = f"""
+import sys
+import main
+dict_result = main.clip(args=["--path_content", {str(tmp_path / "video.mp4")!r}, "--path_result", {str(tmp_path / "test")!r},
+                              "--clip_bounds", "10", "40", "--duration_max", "20", "--snack_id", "2", "--finalize_type", "", "--quiet"], download=False)
+print(dict_result["results"])
+print("pandas" in sys.modules)
+"""
+    proc = subprocess.run([sys.executable, "-c", script], cwd=DIR_REPO, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=dict(os.environ, CLIP_EXTRACTOR_CACHE=str(tmp_path / "cache")), timeout=60)
+    assert proc.stdout.decode().splitlines()[-1] == "False", proc.stderr.decode()
+    list_results = json.loads((tmp_path / "test" / "data.json").read_text())["results"]
+    assert list_results == [{"time_begin": 10.0, "time_end": 30.0, "path": "", "alignment_type": None,
+                             "event_type": "transcript", "snack_id": 2}]
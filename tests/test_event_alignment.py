@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_retrieval import event_alignment
+from event_index import EventIndex
+from benchmark import synthetic_events, frames_match
+
+LIST_NUMERIC = ["time_begin", "time_end"]
+
+
+def events(list_times, score=1.0, source_event="shot"):
+    return pd.DataFrame([{"time_begin": x[0], "time_end": x[1], "time_event": x[0], "source_event": source_event,
+                          "tag_type": "shot", "tag": "shot", "score": score, "details": "", "extractor": "test"}
+                         for x in list_times],
+                        columns=["time_begin", "time_end", "time_event", "source_event", "tag_type", "tag", "score",
+                                 "details", "extractor"])
+
+
+def scenes(list_times):
+    return pd.DataFrame(list_times, columns=["time_begin", "time_end"])
+
+
+def both_engines(df_events, df_scenes, max_duration=-1, df_fallback=None, score_threshold=0.5, allow_flip=True):
+    df_numpy = event_alignment(df_events, df_scenes, max_duration, -1, df_fallback, score_threshold, allow_flip, engine='numpy')
+    df_pandas = event_alignment(df_events, df_scenes, max_duration, -1, df_fallback, score_threshold, allow_flip, engine='pandas')
+    assert frames_match(df_numpy.reset_index(drop=True), df_pandas.reset_index(drop=True), LIST_NUMERIC), \
+        f"\n{df_numpy}\n{df_pandas}"
+    return df_numpy
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_random_parity(seed):
+    rng = np.random.default_rng(seed)
+    duration = float(rng.uniform(60, 600))
+    df_events = synthetic_events(duration, int(rng.integers(20, 3000)), num_tags=3, seed=seed)
+    df_fallback = synthetic_events(duration, int(rng.integers(20, 3000)), num_tags=1, seed=seed + 100, source_event="shot")
+    time_begin = np.sort(rng.uniform(-10, duration + 10, int(rng.integers(1, 40))))
+    df_scenes = scenes(np.stack([time_begin, time_begin + rng.uniform(0, 60, len(time_begin))], axis=1))
+    for allow_flip in [True, False]:
+        for df_fall in [None, df_fallback]:
+            for max_duration in [-1, 5, 30]:
+                for score_threshold in [0.0, 0.5, 0.9, 1.1]:   # 1.1 leaves no events above the threshold
+                    both_engines(df_events, df_scenes, max_duration, df_fall, score_threshold, allow_flip)
+
+
+def test_nearest_boundaries():
+    df = both_engines(events([(0, 2), (10, 12), (20, 22), (30, 32)]), scenes([(11, 19), (21, 29)]))
+    assert list(df["time_begin"]) == [10, 20] and list(df["time_end"]) == [22, 32]
+    assert df["event_begin"][0]["time_begin"] == 10 and df["event_end"][1]["time_end"] == 32
+
+
+def test_max_duration():
+    df = both_engines(events([(0, 2), (10, 12)]), scenes([(1, 30)]), max_duration=5, allow_flip=False)
+    assert df["time_begin"][0] == 0 and df["time_end"][0] == 6   # no later end, capped from the scene begin
+    df = both_engines(events([(0, 2), (10, 12)]), scenes([(1, 30)]), max_duration=5, allow_flip=True)
+    assert df["time_end"][0] == 10   # flipped inward to the latest event begin
+
+
+def test_allow_flip():
+    # nothing begins before the scene, so the begin flips inward to the nearest event end
+    df_events = events([(20, 22), (30, 32)])
+    df = both_engines(df_events, scenes([(5, 25)]), allow_flip=True)
+    assert df["time_begin"][0] == 22 and df["time_end"][0] == 32
+    df = both_engines(df_events, scenes([(5, 25)]), allow_flip=False)
+    assert df["time_begin"][0] == 0 and df["event_begin"][0] is None
+
+
+def test_fallback_events():
+    df_events = events([(20, 22), (30, 32)])
+    df_fallback = events([(4, 4.5)], source_event="fallback")
+    df = both_engines(df_events, scenes([(5, 25)]), df_fallback=df_fallback, allow_flip=False)
+    assert df["time_begin"][0] == 4 and df["event_begin"][0]["source_event"] == "fallback"
+    df = both_engines(df_events, scenes([(5, 25)]), df_fallback=df_fallback, allow_flip=True)
+    assert df["time_begin"][0] == 22   # the flipped end is closer to the scene center than the fallback
+    df = both_engines(df_events, scenes([(5, 9)]), df_fallback=df_fallback, allow_flip=True)
+    assert df["time_begin"][0] == 4
+
+
+def test_score_threshold():
+    df_events = pd.concat([events([(10, 12)], score=0.4), events([(0, 2)], score=0.9)], ignore_index=True)
+    assert both_engines(df_events, scenes([(11, 20)]), score_threshold=0.5)["time_begin"][0] == 0
+    assert both_engines(df_events, scenes([(11, 20)]), score_threshold=0.4)["time_begin"][0] == 10
+
+
+def test_empty_events():
+    df = both_engines(events([]), scenes([(5, 25)]), max_duration=10, allow_flip=False)
+    assert df["time_begin"][0] == 0 and df["time_end"][0] == 15 and df["event_end"][0] is None
+    df = both_engines(events([]), scenes([(5, 25)]), df_fallback=events([(1, 2), (30, 31)]), allow_flip=False)
+    assert df["time_begin"][0] == 1 and df["time_end"][0] == 31
+
+
+def test_empty_scenes():
+    assert len(both_engines(events([(0, 2)]), scenes([]))) == 0
+
+
+def test_event_index_input():
+    df_events = synthetic_events(300, 2000, num_tags=3, seed=1)
+    df_scenes = scenes([(10, 40), (100, 160), (250, 320)])
+    df_index = event_alignment(EventIndex(df_events), df_scenes, 30, engine='numpy')
+    assert frames_match(df_index, event_alignment(df_events, df_scenes, 30, engine='pandas').reset_index(drop=True),
+                        LIST_NUMERIC)
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_index import EventIndex
+from benchmark import synthetic_events
+
+
+def brute_force(df, time_begin, time_end):
+    return sorted(df.index[(df["time_begin"] <= time_end) & (df["time_end"] >= time_begin)])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlapping_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    df = synthetic_events(600, int(rng.integers(10, 5000)), num_tags=4, seed=seed)
+    df["time_end"] = df["time_begin"] + rng.exponential(5, len(df))   # a few long events span many short ones
+    index = EventIndex(df)
+    df = index.df
+    for time_begin in rng.uniform(-20, 620, 50):
+        time_end = time_begin + float(rng.choice([0, 0.5, 10, 100]))
+        assert sorted(index.overlapping(time_begin, time_end).index) == brute_force(df, time_begin, time_end)
+
+
+def test_overlapping_edges():
+    index = EventIndex(pd.DataFrame({"time_begin": [0.0, 5.0, 10.0], "time_end": [100.0, 6.0, 12.0], "score": 1.0}))
+    assert list(index.overlapping(6, 6)["time_begin"]) == [0, 5]   # touching ends count
+    assert list(index.overlapping(101, 200)["time_begin"]) == []
+    assert list(index.overlapping(12, 20)["time_begin"]) == [0, 10]
+    assert len(EventIndex(None).overlapping(0, 10)) == 0
+    assert list(index.subset(score_threshold=2).overlapping(0, 10)["time_begin"]) == []
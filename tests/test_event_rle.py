@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_retrieval import event_rle
+from benchmark import synthetic_events, frames_match
+
+LIST_NUMERIC = ["time_begin", "time_end", "score"]
+
+
+def events(list_rows, tag="tag_0"):
+    """Events from (time_begin, time_end, score) tuples, one tag unless rows carry a fourth tag value"""
+    return pd.DataFrame([{"time_begin": x[0], "time_end": x[1], "time_event": x[0], "source_event": "face",
+                          "tag_type": "identity", "tag": x[3] if len(x) > 3 else tag, "score": x[2], "details": "",
+                          "extractor": "test"} for x in list_rows],
+                        columns=["time_begin", "time_end", "time_event", "source_event", "tag_type", "tag", "score",
+                                 "details", "extractor"])
+
+
+def both_engines(df, *args):
+    df_numpy = event_rle(df, *args, engine='numpy')
+    df_pandas = event_rle(df, *args, engine='pandas')
+    assert frames_match(df_numpy, df_pandas, LIST_NUMERIC), f"\n{df_numpy}\n{df_pandas}"
+    return df_numpy
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_random_parity(seed):
+    rng = np.random.default_rng(seed)
+    df = synthetic_events(duration=float(rng.uniform(30, 900)), events_per_hour=int(rng.integers(500, 30000)),
+                          num_tags=int(rng.integers(1, 8)), seed=seed)
+    for _ in range(4):
+        both_engines(df, float(rng.choice([0.6, 0.8, 0.9])), float(rng.choice([0, 3, 10])),
+                     float(rng.choice([0.7, 1, 2.5, 3])))
+
+
+def test_empty():
+    df = both_engines(events([]), 0.8, 10, 3)
+    assert len(df) == 0 and list(df.columns) == LIST_NUMERIC + ["tag", "source_event", "tag_type"]
+
+
+def test_none():
+    assert event_rle(None, engine='numpy') is None and event_rle(None, engine='pandas') is None
+
+
+def test_one_event():
+    df = both_engines(events([(5.0, 6.0, 0.9)]), 0.8, 0, 3)
+    assert len(df) == 1 and df["time_begin"][0] == 5.0   # as a group's last run, its score averages no buckets
+    assert len(both_engines(events([(5.0, 6.0, 0.9)]), 0.8, 10, 3)) == 0   # too short for the duration threshold
+
+
+def test_ties_at_threshold():
+    # a bin averaging exactly to the threshold is not above it; 0.5 and 1.0 average exactly to 0.75
+    list_rows = [(t, t + 0.5, 0.75) for t in np.arange(0, 30, 0.5)]
+    assert len(both_engines(events(list_rows), 0.75, 3, 3)) == 0
+    list_rows = [(t, t + 0.25, 0.5 if idx % 2 else 1.0) for idx, t in enumerate(np.arange(0, 30, 0.25))]
+    assert len(both_engines(events(list_rows), 0.75, 3, 3)) == 0
+    assert len(both_engines(events(list_rows), 0.74, 3, 3)) == 1
+
+
+def test_events_longer_than_expand():
+    list_rows = [(t, t + 10, 0.95 if 20 <= t < 60 else 0.1) for t in np.arange(0, 90, 1.0)]
+    df = both_engines(events(list_rows), 0.8, 6, 2)
+    assert len(df) == 1 and df["time_end"][0] - df["time_begin"][0] > 10
+
+
+def test_groups_and_missing_keys():
+    list_rows = [(t, t + 1, 0.9, "a") for t in range(0, 40)] + [(t, t + 1, 0.9, "b") for t in range(20, 70, 2)] \
+        + [(t, t + 1, 0.9, None) for t in range(0, 40)]   # groupby drops rows without a tag
+    df = both_engines(events(list_rows), 0.8, 6, 3)
+    assert sorted(df["tag"].unique()) == ["a", "b"]
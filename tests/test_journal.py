@@ -0,0 +1,62 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from journal import ResultJournal
+
+
+def record(tmp_path, time_begin, time_end, thumbnail=True):
+    path_clip = tmp_path / f"video.{time_begin:.2f}-{time_end:.2f}.mp4"
+    path_clip.write_bytes(b"clip")
+    return {"time_begin": time_begin, "time_end": time_end, "path": str(path_clip),
+            "thumbnail": str(path_clip.with_suffix(".jpg")) if thumbnail else ""}
+
+
+def test_resume_needs_files(tmp_path):
+    journal = ResultJournal(tmp_path / "journal.jsonl", {"input": "a"})
+    for time_begin in [0, 10, 20]:
+        journal.append(record(tmp_path, time_begin, time_begin + 5, thumbnail=False))
+    journal.close()
+    (tmp_path / "video.10.00-15.00.mp4").unlink()
+    journal = ResultJournal(tmp_path / "journal.jsonl", {"input": "a"})
+    assert journal.finished(0, 5) is not None and journal.finished(10, 15) is None and journal.finished(30, 35) is None
+    assert ResultJournal(tmp_path / "journal.jsonl", {"input": "b"}).finished(0, 5) is None   # a different run
+
+
+def test_pending_thumbnail_is_not_finished(tmp_path):
+    journal = ResultJournal(tmp_path / "journal.jsonl", {"input": "a"})
+    dict_record = record(tmp_path, 0, 5)
+    journal.append(dict_record)   # journaled while the source thumbnails were still being made
+    assert journal.finished(0, 5) is None
+    with open(dict_record["thumbnail"], 'wb') as f:
+        f.write(b"jpg")
+    assert journal.finished(0, 5) is not None
+    journal.close()
+
+
+def test_torn_last_line(tmp_path):
+    journal = ResultJournal(tmp_path / "journal.jsonl", {"input": "a"})
+    journal.append(record(tmp_path, 0, 5, thumbnail=False))
+    journal.close()
+    with open(tmp_path / "journal.jsonl", 'at') as f:
+        f.write(json.dumps(record(tmp_path, 10, 15, thumbnail=False))[:20])   # a crash mid-write
+    journal = ResultJournal(tmp_path / "journal.jsonl", {"input": "a"})
+    journal.append(record(tmp_path, 20, 25, thumbnail=False))
+    journal.close()
+    journal = ResultJournal(tmp_path / "journal.jsonl", {"input": "a"})
+    assert [x["time_begin"] for x in journal.results([(0, 5), (10, 15), (20, 25)])] == [0, 20]
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_repeated_scenes_each_finish(tmp_path):
+    from getclips import get_clips
+
+    path_video = tmp_path / "source.mp4"
+    subprocess.run(["ffmpeg", "-v", "quiet", "-f", "lavfi", "-i", "testsrc=duration=8:size=160x90:rate=10",
+                    "-pix_fmt", "yuv420p", str(path_video)], check=True)
+    list_done = []
+    list_clips = get_clips(str(path_video), [(1, 3), (4, 6), (1, 3)], str(tmp_path / "clips"), profile="default",
+                           batch_size=1, clip_done=lambda idx, clip: list_done.append((idx, clip)))
+    assert sorted(list_done) == sorted(enumerate(list_clips)) and list_clips[0] == list_clips[2]
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import asyncio
+import subprocess
+
+import pytest
+
+from media_runner import MediaRunner, run_sync
+
+DIR_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_timeout_kills():
+    time_start = time.monotonic()
+    result = run_sync(MediaRunner(timeout=0.3).run(["sleep", "5"], stderr=True))
+    assert result.timed_out and result.returncode == -1 and time.monotonic() - time_start < 3
+
+
+def test_into_buffer():
+    buffer = bytearray(4)
+    result = run_sync(MediaRunner().run(["printf", "abcdefgh"], into=buffer))
+    assert result.returncode == 0 and result.num_read == 4 and bytes(buffer) == b"abcd"
+
+
+def test_cancel_while_starting_kills(monkeypatch):
+    """A cancel that lands after the process exists but before create_subprocess_exec returns it"""
+    list_started = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def slow_start(*args, **kwargs):
+        proc = await create_subprocess_exec(*args, **kwargs)
+        list_started.append(proc)
+        await asyncio.sleep(0.5)
+        return proc
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", slow_start)
+
+    async def cancel_start():
+        task = asyncio.ensure_future(MediaRunner().run(["sleep", "5"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return task.cancelled()
+    assert run_sync(cancel_start())
+    assert len(list_started) == 1 and list_started[0].returncode is not None   # killed and reaped
+
+
+@pytest.mark.parametrize("mode", ["cancel", "timeout"])
+def test_no_transport_left_open(mode):
+    # writers whose pipes are still busy (the shell's children outlive it) when the loop is closed
+    script = f"""
+import asyncio
+from media_runner import MediaRunner, run_sync
+cmd = ["sh", "-c", "yes 1>&2 & yes; wait"]
+async def early_stop():
+    runner = MediaRunner(4, timeout=0.3 if "{mode}" == "timeout" else None)
+    list_tasks = [asyncio.ensure_future(runner.run(cmd, stderr=True)) for _ in range(4)]
+    if "{mode}" == "cancel":
+        await asyncio.sleep(0.3)
+        for task in list_tasks:
+            task.cancel()
+    await asyncio.gather(*list_tasks, return_exceptions=True)
+run_sync(early_stop())
+import gc
+gc.collect()
+print("done")
+"""
+    proc = subprocess.run([sys.executable, "-c", script], cwd=DIR_REPO, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, timeout=30)
+    assert proc.stdout.decode().strip() == "done"
+    assert b"Event loop is closed" not in proc.stderr and b"Exception ignored" not in proc.stderr
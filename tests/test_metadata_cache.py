@@ -0,0 +1,63 @@
+import os
+import json
+
+import pytest
+
+import metadata_cache
+from metadata_cache import metadata_states
+from event_retrieval import parse_results
+from contentai_metadata_flatten.parsers import get_by_name
+
+
+def write_moderation(dir_content, porn):
+    """dsai_moderation output, which that parser reads from 'dsai_moderation_image' (not its module name)"""
+    dir_extractor = os.path.join(dir_content, "dsai_moderation_image")
+    os.makedirs(dir_extractor, exist_ok=True)
+    dict_data = {"config": {"version": 1}, "results": [{"time_event": float(t), "time_frame": t * 24, "scores":
+                 {"porn": str(porn), "neutral": "0.1", "sexy": "0.01"}} for t in range(20)]}
+    with open(os.path.join(dir_extractor, "data.json"), 'wt') as f:
+        json.dump(dict_data, f)
+
+
+@pytest.fixture
+def dir_content(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLIP_EXTRACTOR_CACHE", str(tmp_path / "cache"))
+    metadata_cache._metadata_memory.clear()
+    write_moderation(str(tmp_path / "meta"), 0.9)
+    return str(tmp_path / "meta")
+
+
+def test_key_follows_extractor_directory(dir_content):
+    list_modules = get_by_name("dsai_moderation")
+    key = metadata_states(dir_content, list_modules)["dsai_moderation"]
+    os.makedirs(os.path.join(dir_content, "test"))
+    with open(os.path.join(dir_content, "test", "data.json"), 'wt') as f:   # results beside the metadata
+        f.write("{}")
+    assert metadata_states(dir_content, list_modules)["dsai_moderation"] == key
+    write_moderation(dir_content, 0.6)
+    path_data = os.path.join(dir_content, "dsai_moderation_image", "data.json")
+    os.utime(path_data, ns=(os.stat(path_data).st_atime_ns, os.stat(path_data).st_mtime_ns + 10 ** 9))
+    assert metadata_states(dir_content, list_modules)["dsai_moderation"] != key
+
+
+def test_edited_extractor_output_is_parsed_again(dir_content):
+    df = parse_results(dir_content, "moderation")
+    assert set(df[df["tag"] == "pornography"]["score"]) == {0.9}
+    write_moderation(dir_content, 0.6)
+    path_data = os.path.join(dir_content, "dsai_moderation_image", "data.json")
+    os.utime(path_data, ns=(os.stat(path_data).st_atime_ns, os.stat(path_data).st_mtime_ns + 10 ** 9))
+    df = parse_results(dir_content, "moderation")
+    assert set(df[df["tag"] == "pornography"]["score"]) == {0.6}
+    metadata_cache._metadata_memory.clear()   # and from the disk cache, not only memory
+    df = parse_results(dir_content, "moderation")
+    assert set(df[df["tag"] == "pornography"]["score"]) == {0.6}
+
+
+def test_unknown_extractor_misses(dir_content, monkeypatch):
+    list_modules = get_by_name("dsai_moderation")
+    monkeypatch.setitem(metadata_cache._parser_extractors, "dsai_moderation", None)
+    key = metadata_states(dir_content, list_modules)["dsai_moderation"]
+    write_moderation(dir_content, 0.6)
+    path_data = os.path.join(dir_content, "dsai_moderation_image", "data.json")
+    os.utime(path_data, ns=(os.stat(path_data).st_atime_ns, os.stat(path_data).st_mtime_ns + 10 ** 9))
+    assert metadata_states(dir_content, list_modules)["dsai_moderation"] != key
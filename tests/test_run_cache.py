@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import main
+import metadata_cache
+from benchmark import synthetic_metadata
+
+
+@pytest.fixture
+def asset(tmp_path, monkeypatch):
+    """The documented layout: extractor outputs beside the video and the result directory inside it"""
+    monkeypatch.setenv("CLIP_EXTRACTOR_CACHE", str(tmp_path / "cache"))
+    metadata_cache._metadata_memory.clear()
+    dir_asset = tmp_path / "asset"
+    synthetic_metadata(str(dir_asset), duration=300, events_per_hour=20000, num_tags=5)
+    (dir_asset / "video.mp4").write_bytes(os.urandom(1 << 16))   # only fingerprinted, never decoded without a profile
+    return dir_asset
+
+
+def run_args(dir_asset, *args):
+    return ["--path_content", str(dir_asset / "video.mp4"), "--path_result", str(dir_asset / "test"), "--quiet",
+            "--event_type", "tag", "--event_min_score", "0.5", "--alignment_type", "scene", "--finalize_type", "",
+            "--duration_max", "30", "--csv_file", "out.csv"] + list(args)
+
+
+def cache_entries(dir_asset, kind):
+    dir_runs = dir_asset.parent / "cache" / "runs"
+    return sorted([x for x in os.listdir(dir_runs) if x.startswith(kind + ".")]) if dir_runs.exists() else []
+
+
+def test_identical_run_returns_cached_result(asset, monkeypatch):
+    dict_first = main.clip(args=run_args(asset), download=False)
+    assert dict_first is not None and len(dict_first["results"])
+    assert len(cache_entries(asset, "result")) == 1 and len(cache_entries(asset, "scenes")) == 1
+
+    def no_stage(*args, **kwargs):
+        raise AssertionError("a cached run should not parse, detect, or align again")
+    monkeypatch.setattr("event_retrieval.parse_results", no_stage)
+    monkeypatch.setattr("event_retrieval.event_alignment", no_stage)
+    dict_second = main.clip(args=run_args(asset), download=False)
+    assert dict_second["config"]["timestamp"] == dict_first["config"]["timestamp"]   # the stored result itself
+    assert json.loads(json.dumps(dict_second["results"])) == json.loads(json.dumps(dict_first["results"]))
+    assert len(cache_entries(asset, "result")) == 1 and len(cache_entries(asset, "scenes")) == 1
+
+
+def test_other_output_options_reuse_scenes(asset, monkeypatch):
+    dict_first = main.clip(args=run_args(asset), download=False)
+    monkeypatch.setattr("event_retrieval.event_alignment", lambda *args, **kwargs: pytest.fail("scenes should be reused"))
+    dict_second = main.clip(args=run_args(asset, "--snack_id", "4"), download=False)
+    assert len(cache_entries(asset, "result")) == 2 and len(cache_entries(asset, "scenes")) == 1
+    assert [(x["time_begin"], x["time_end"]) for x in dict_second["results"]] == \
+        [(x["time_begin"], x["time_end"]) for x in dict_first["results"]]
+    assert all([x["snack_id"] == 4 for x in dict_second["results"]])
+
+
+def test_changed_metadata_runs_again(asset):
+    main.clip(args=run_args(asset), download=False)
+    path_places = asset / "dsai_places" / "data.json"
+    os.utime(path_places, ns=(os.stat(path_places).st_atime_ns, os.stat(path_places).st_mtime_ns + 10 ** 9))
+    main.clip(args=run_args(asset), download=False)
+    assert len(cache_entries(asset, "result")) == 2 and len(cache_entries(asset, "scenes")) == 2
+
+
+def test_run_no_cache(asset):
+    main.clip(args=run_args(asset, "--run_no_cache"), download=False)
+    assert cache_entries(asset, "result") == [] and cache_entries(asset, "scenes") == []
+
+
+def test_changed_extractor_directory_runs_again(asset):
+    # dsai_moderation reads 'dsai_moderation_image', not a directory named after the parser
+    os.makedirs(asset / "dsai_moderation_image")
+    with open(asset / "dsai_moderation_image" / "data.json", 'wt') as f:
+        json.dump({"config": {}, "results": [{"time_event": 1.0, "scores": {"porn": "0.9", "neutral": "0.1"}}]}, f)
+    main.clip(args=run_args(asset), download=False)
+    with open(asset / "dsai_moderation_image" / "data.json", 'at') as f:
+        f.write(" ")
+    main.clip(args=run_args(asset), download=False)
+    assert len(cache_entries(asset, "result")) == 2
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_overwrite_cuts_again(tmp_path, monkeypatch):
+    import getclips
+
+    monkeypatch.setenv("CLIP_EXTRACTOR_CACHE", str(tmp_path / "cache"))
+    path_video = tmp_path / "video.mp4"
+    subprocess.run(["ffmpeg", "-v", "quiet", "-f", "lavfi", "-i", "testsrc=duration=6:size=160x90:rate=10",
+                    "-pix_fmt", "yuv420p", str(path_video)], check=True)
+    list_calls = []
+    get_clips = getclips.get_clips
+    def get_clips_logged(*args, **kwargs):
+        list_calls.append(kwargs["overwrite"])
+        return get_clips(*args, **kwargs)
+    monkeypatch.setattr(getclips, "get_clips", get_clips_logged)
+    list_args = ["--path_content", str(path_video), "--path_result", str(tmp_path / "result"), "--quiet",
+                 "--clip_bounds", "1", "4", "--profile", "default"]
+    dict_first = main.clip(args=list_args, download=False)
+    path_clip = dict_first["results"][0]["path"]
+    mtime = os.stat(path_clip).st_mtime_ns
+    main.clip(args=list_args, download=False)
+    assert list_calls == [False]   # the stored result was reused
+    main.clip(args=list_args + ["--overwrite"], download=False)
+    assert list_calls == [False, True] and os.stat(path_clip).st_mtime_ns != mtime
@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from benchmark import synthetic_video
+from getclips import get_clips, thumb
+from mediainfo import probe
+from media_runner import run_media
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+def image_rows(path_image):
+    """Rows and mean luma of each row of an image, decoded as raw grayscale"""
+    info = probe(path_image)
+    result = run_media(["ffmpeg", "-v", "quiet", "-i", path_image, "-f", "rawvideo", "-pix_fmt", "gray", "-"])
+    return np.frombuffer(result.stdout, dtype=np.uint8).reshape(info.height, info.width).mean(axis=1)
+
+
+@pytest.mark.parametrize("thumbnail_mode", ["source", "clip"])
+def test_letterbox_thumbnails_are_cropped(tmp_path, monkeypatch, thumbnail_mode):
+    monkeypatch.setenv("CLIP_EXTRACTOR_CACHE", str(tmp_path / "cache"))
+    path_video = synthetic_video(str(tmp_path / "padded.mp4"), duration=12, size="320x240", letterbox=40)
+    list_clips = get_clips(path_video, [(1, 4), (6, 9)], str(tmp_path / "clips"), profile="letterbox",
+                           thumbnail_mode=thumbnail_mode)
+    for path_clip in list_clips:
+        info_clip = probe(path_clip)
+        info_thumb = probe(thumb(path_clip))
+        assert (info_thumb.width, info_thumb.height) == (info_clip.width, info_clip.height)
+        assert info_thumb.height < 240 - 40   # the padding is gone
+        rows = image_rows(thumb(path_clip))
+        assert rows[:4].mean() > 32 and rows[-4:].mean() > 32   # no black bars left at the top or bottom
+
+
+def test_thumbnail_filter_then_scale(tmp_path):
+    path_video = synthetic_video(str(tmp_path / "padded.mp4"), duration=4, size="320x240", letterbox=40)
+    list_thumbs = [str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg")]
+    from getclips import make_thumbnails
+    assert make_thumbnails(path_video, [(0, 2), (2, 4)], list_thumbs, size="80", filter_video="crop=320:160:0:40") == 0
+    for path_thumb in list_thumbs:
+        info = probe(path_thumb)
+        assert (info.width, info.height) == (80, 40)
+        assert os.path.getsize(path_thumb) > 0